@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import numpy as np
+
+# ===============================================================================================
+# Analytics over the returns of histories: empirical cumulative distribution functions and
+# quantiles of a sample, computed from one sort of it, and a streaming estimate of a quantile (the
+# P2 algorithm of Jain and Chlamtac, 1985), which keeps five markers whatever the number of values.
+# The p-quantile of a sample is the least value v such that the proportion of values <= v is at
+# least p.
+# ===============================================================================================
+
+# Returns the distinct values of a sample in increasing order, and for each of them the proportion
+# of values of the sample which are lower or equal to it
+def empiricalCDF (values):
+    (uniqueValues,counts) = np.unique(np.asarray(values), return_counts=True)
+    return uniqueValues, np.cumsum(counts)/float(counts.sum())
+
+# Returns the p-quantile of a sample, or the array of quantiles if p is a sequence
+def quantile (values, p):
+    (uniqueValues,cdf) = empiricalCDF(values)
+    positions = np.minimum(np.searchsorted(cdf,p), len(uniqueValues)-1)
+    return uniqueValues[positions]
+
+
+class P2Quantile ():
+
+    def __init__ (self, p):
+        self.p = p
+        self.count = 0
+        # Heights and (actual and desired) positions of the five markers, and the increments of desired
+        # positions; the first five values are kept as heights
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desiredPositions = [1., 1+2*p, 1+4*p, 3+2*p, 5.]
+        self.increments = [0., p/2., p, (1+p)/2., 1.]
+
+    def add (self, value):
+        self.count += 1
+        heights = self.heights
+        if self.count <= 5:
+            heights.append(value)
+            heights.sort()
+            return
+        positions = self.positions
+        # Cell of the value, adjusting the extreme markers
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell+1]:
+                cell += 1
+        for i in xrange(cell+1,5):
+            positions[i] += 1
+        for i in xrange(5):
+            self.desiredPositions[i] += self.increments[i]
+        # Adjusts the middle markers
+        for i in xrange(1,4):
+            difference = self.desiredPositions[i]-positions[i]
+            if (difference >= 1 and positions[i+1]-positions[i] > 1) or (difference <= -1 and positions[i-1]-positions[i] < -1):
+                direction = 1 if difference > 0 else -1
+                height = self.getParabolicHeight(i,direction)
+                if not heights[i-1] < height < heights[i+1]:
+                    height = heights[i]+direction*(heights[i+direction]-heights[i])/float(positions[i+direction]-positions[i])
+                heights[i] = height
+                positions[i] += direction
+
+    def getParabolicHeight (self, i, direction):
+        heights = self.heights
+        positions = self.positions
+        return heights[i]+direction/float(positions[i+1]-positions[i-1])*(
+            (positions[i]-positions[i-1]+direction)*(heights[i+1]-heights[i])/float(positions[i+1]-positions[i])
+            +(positions[i+1]-positions[i]-direction)*(heights[i]-heights[i-1])/float(positions[i]-positions[i-1]))
+
+    # Current estimate of the p-quantile (exact while there are at most five values; None if none)
+    def getValue (self):
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return quantile(self.heights,self.p)
+        return self.heights[2]
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import numpy as np
+
+from rng import *
+from metrics import *
+
+# ===============================================================================================
+# Batched versions of the Q learner and of the QQ learner, which run nbAgents independent learners
+# in lockstep on independent trajectories of the same MDP. Every per-learner quantity is stored in
+# a NumPy array whose first axis is the learner, states and actions are given by their ids in the
+# compiled MDP, and each of chooseActions, drawNextStates and inform is one vectorised operation
+# over all learners. Learner n behaves as an epsilon-greedy QLearning (resp. QQLearning) with the
+# same parameters, up to the random numbers drawn.
+#
+# DataCenter is not handled: its reward depends on costs accumulated along the whole history.
+# ===============================================================================================
+
+class BatchQLearning ():
+
+    # Initial state: from which it tries to maximise reward
+    # Epsilon: if random(1)<epsilon, exploration
+    # Seed: seed of the random generator shared by all learners (see rng), drawn from the global
+    # generator if None
+    def __init__ (self, mdp, initialState, epsilon, nbAgents, seed=None):
+        if mdp.mdpType == "DataCenter":
+            raise ValueError("Batched learners do not handle the DataCenter MDP")
+        self.mdp = mdp
+        self.mdp.buildAliasTables()
+        self.initialState = initialState
+        self.initialStateId = mdp.stateIndex[initialState]
+        self.epsilon = epsilon
+        self.nbAgents = nbAgents
+        self.random = RandomStream(seed,"batch").generator
+        nbStates = len(mdp.getStates())
+        nbActions = len(mdp.getActions())
+        nbWealthLevels = len(mdp.getWealthLevels())
+        self.reinitId = mdp.actionIndex["reinit"]
+        self.horizon = mdp.horizon if mdp.horizon is not None else -1
+        # Allowed actions of each state, as ids padded with -1
+        self.nbAllowed = mdp.allowedMask.sum(axis=1)
+        self.allowedActionIds = np.empty((nbStates,max(1,self.nbAllowed.max())), dtype=np.int64)
+        self.allowedActionIds.fill(-1)
+        for stateId in xrange(nbStates):
+            actionIds = np.flatnonzero(mdp.allowedMask[stateId])
+            self.allowedActionIds[stateId,:len(actionIds)] = actionIds
+        self.agentIds = np.arange(nbAgents)
+        self.counters = np.zeros(nbAgents, dtype=np.int64)
+        self.nbVisits = np.zeros((nbAgents,nbStates), dtype=np.int64)
+        self.nbExperiences = np.zeros((nbAgents,nbStates,nbActions), dtype=np.int64)
+        self.QValues = np.zeros((nbAgents,nbStates,nbActions))
+        self.wealth_frequencies = np.empty((nbAgents,nbWealthLevels))
+        self.wealth_frequencies.fill(1/float(nbWealthLevels))
+        self.real_wealth_frequencies = self.wealth_frequencies.copy()
+        self.bestResponseValue = []
+        self.score = []
+        self.histories = [[] for n in xrange(nbAgents)]
+        # Debug information
+        self.nbEpsilons = np.zeros(nbAgents, dtype=np.int64)
+        self.nbSoleActions = np.zeros(nbAgents, dtype=np.int64)
+        self.nbExploitations = np.zeros(nbAgents, dtype=np.int64)
+        self.nbWealthObtained = np.zeros(nbAgents, dtype=np.int64)
+        self.realNbWealthObtained = np.zeros(nbAgents, dtype=np.int64)
+
+    # Forced "reinit" at the horizon, as in QLearning (counter incremented before the test)
+    def getForcedReinits (self):
+        self.counters += 1
+        return self.counters == self.horizon
+
+    # One action per learner, for an array of current state ids
+    def chooseActions (self, stateIds):
+        forced = self.getForcedReinits()
+        nbAllowed = self.nbAllowed[stateIds]
+        sole = ~forced & (nbAllowed==1)
+        explores = ~forced & ~sole & (self.random.random_sample(self.nbAgents)<self.epsilon)
+        exploits = ~forced & ~sole & ~explores
+        self.nbSoleActions += sole
+        self.nbEpsilons += explores
+        self.nbExploitations += exploits
+        randomActions = self.allowedActionIds[stateIds,(self.random.random_sample(self.nbAgents)*nbAllowed).astype(np.int64)]
+        actions = np.where(explores, randomActions, self.getBestActions(stateIds))
+        actions = np.where(sole, self.allowedActionIds[stateIds,0], actions)
+        return np.where(forced, self.reinitId, actions)
+
+    # Random choice between allowed actions with best value, for each learner
+    def getBestActions (self, stateIds):
+        values = self.getAllowedQValues(stateIds)
+        isBest = values == values.max(axis=1)[:,np.newaxis]
+        return np.where(isBest, self.random.random_sample(values.shape), -1.).argmax(axis=1)
+
+    # Q values of the learners in their respective states, -infinity for actions not allowed
+    def getAllowedQValues (self, stateIds):
+        return np.where(self.mdp.allowedMask[stateIds], self.QValues[self.agentIds,stateIds], -np.inf)
+
+    def getMaxQValues (self, stateIds):
+        return self.getAllowedQValues(stateIds).max(axis=1)
+
+    def drawNextStates (self, stateIds, actionIds):
+        self.counters[actionIds==self.reinitId] = 0
+        return self.mdp.drawNextStateIds(stateIds, actionIds, self.random.random_sample(self.nbAgents))
+
+    # Informs the learners of their experienced transitions
+    def inform (self, stateIds, actionIds, nextStateIds):
+        isFinal = self.mdp.finalMask[nextStateIds]
+        self.recordWealthLevels(isFinal, self.mdp.wealthIds[nextStateIds])
+        targets = self.getRewards(isFinal, self.mdp.wealthIds[nextStateIds])+self.getMaxQValues(nextStateIds)
+        self.update(stateIds, actionIds, targets)
+
+    # Histories and counters of wealth levels obtained, for learners which reached a final state
+    def recordWealthLevels (self, isFinal, wealthIds):
+        self.nbWealthObtained += isFinal
+        self.realNbWealthObtained += isFinal
+        for n in np.flatnonzero(isFinal):
+            self.histories[n].append(self.mdp.wealthLevels[wealthIds[n]])
+
+    def getRewards (self, isFinal, wealthIds):
+        return np.zeros(self.nbAgents)
+
+    def update (self, stateIds, actionIds, targets):
+        self.nbVisits[self.agentIds,stateIds] += 1
+        self.nbExperiences[self.agentIds,stateIds,actionIds] += 1
+        learns = ~self.mdp.finalMask[stateIds]
+        agentIds = self.agentIds[learns]
+        stateIds = stateIds[learns]
+        actionIds = actionIds[learns]
+        values = self.QValues[agentIds,stateIds,actionIds]
+        alphas = self.getAlpha(self.nbExperiences[agentIds,stateIds,actionIds])
+        self.QValues[agentIds,stateIds,actionIds] = values+alphas*(targets[learns]-values)
+
+    # Handling of data structures ===================================================
+    # alpha_t: update of wealth expectations
+    def getAlpha (self, nbExperiences):
+        return 1./(nbExperiences**(11/float(20)))
+
+    def getGamma (self, nbExperiences):
+        return 1./nbExperiences
+
+    # Learner n as a string-keyed dictionary QValues[state][action], for inspection
+    def getQValues (self, n):
+        return dict((state,dict((action,self.QValues[n,self.mdp.stateIndex[state],self.mdp.actionIndex[action]]) for action in self.mdp.getAllowedActions(state))) for state in self.mdp.getStates())
+
+    def __str__ (self):
+        return "Batch of "+str(self.nbAgents)+" SSQ Q-Learners"
+
+
+class BatchQQLearning (BatchQLearning):
+
+    # Metric capacity: number of arrays of thetas of all learners kept, one every stride steps (see the
+    # "decimate" mode of metrics), so that the memory used does not depend on the number of steps
+    def __init__ (self, mdp, initialState, epsilon, tau, theta, constant, nbAgents, seed=None, metricCapacity=10000):
+        BatchQLearning.__init__(self, mdp, initialState, epsilon, nbAgents, seed)
+        self.initTheta = theta
+        self.theta = np.empty(nbAgents)
+        self.theta.fill(theta)
+        self.thetas = MetricRecorder("decimate", metricCapacity, tailSize=1)
+        self.q = 1 - tau
+        self.constant = constant
+
+    # Forced "reinit" at the horizon, as in QQLearning (counter incremented after the test)
+    def getForcedReinits (self):
+        forced = self.counters == self.horizon
+        self.counters[~forced] += 1
+        return forced
+
+    def inform (self, stateIds, actionIds, nextStateIds):
+        isFinal = self.mdp.finalMask[nextStateIds]
+        wealthIds = self.mdp.wealthIds[nextStateIds]
+        self.recordWealthLevels(isFinal, wealthIds)
+        targets = self.getRewards(isFinal, wealthIds)+self.getMaxQValues(nextStateIds)
+        if isFinal.any():
+            self.update_theta(isFinal)
+            self.updateWealthFrequencies(isFinal, wealthIds)
+        self.thetas.append(self.theta.copy())
+        self.update(stateIds, actionIds, targets)
+
+    # Rewards of reaching wealthIds, for the current theta of each learner (0 if not final)
+    def getRewards (self, isFinal, wealthIds):
+        rewards = np.clip(wealthIds-self.theta+1, 0, 1)
+        return np.where(isFinal, rewards, 0.)
+
+    # Array of rewards indexed by [learner,wealthLevelId]
+    def getRewardVectors (self):
+        wealthIds = np.arange(len(self.mdp.getWealthLevels()))
+        return np.clip(wealthIds[np.newaxis,:]-self.theta[:,np.newaxis]+1, 0, 1)
+
+    # Dynamic mean of real_wealth_frequencies, for learners which reached a final state
+    def updateWealthFrequencies (self, isFinal, wealthIds):
+        agentIds = self.agentIds[isFinal]
+        coefficients = self.getGamma(self.realNbWealthObtained[agentIds])
+        frequencies = self.real_wealth_frequencies[agentIds]
+        isNull = ~frequencies.any(axis=1)
+        frequencies *= (1.-coefficients)[:,np.newaxis]
+        frequencies[np.arange(len(agentIds)),wealthIds[isFinal]] += coefficients
+        frequencies[isNull] = 0.
+        frequencies[isNull,wealthIds[isFinal][isNull]] = 1.
+        self.real_wealth_frequencies[agentIds] = frequencies
+
+    # Update of theta, for learners which reached a final state
+    def update_theta (self, isFinal):
+        sum_p = self.getMaxQValues(np.repeat(self.initialStateId,self.nbAgents))
+        gammas = self.getGamma(np.maximum(self.nbWealthObtained,1).astype(np.float64))
+        steps = np.where(sum_p < self.q, -(1-self.q), self.q)*gammas*self.constant
+        self.theta += np.where(isFinal & (sum_p != 0), steps, 0.)
+
+    def __str__ (self):
+        return "Batch of "+str(self.nbAgents)+" SSQ QQ-Learners"
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import cPickle
+import os
+import random
+
+import numpy as np
+
+from instrumentation import *
+
+# ===============================================================================================
+# Checkpoints of simulations, from which simulate can resume a run with the same result as if it
+# had not been interrupted. A checkpoint holds the full learner, the state of the simulation loop
+# (step, current state, number of episodes), the state of the MDP which changes during a run
+# (counter, cumulatedCost, warm start of the solver, random stream), the trace and statistics if any,
+# and the states of the global random generators (the random streams of learners are saved with them). The MDP itself is not saved: it is referred to in the file, and
+# the MDP given to loadCheckpoint is used in its place. Neither is the instrumentation of the learner
+# (whose sinks write to streams): it is replaced by defaultInstrumentation, until simulate gives the
+# learner its own.
+#
+# Checkpoints are binary pickles (protocol 2), written to a temporary file which is then renamed,
+# so that a checkpoint file is always complete.
+# ===============================================================================================
+
+# Attributes of the MDP which change during a simulation
+mdpRunAttributes = ["counter", "cumulatedCost", "solvedValues", "randomStream"]
+
+# Writes the checkpoint of a simulation, given as a dictionary of the state of the loop, to path
+def saveCheckpoint (path, mdp, agent, simulationState, trace=None, statistics=None):
+    def getPersistentId (obj):
+        if obj is mdp:
+            return "mdp"
+        if isinstance(obj,Instrumentation):
+            return "instrumentation"
+        return None
+    checkpoint = {
+        "agent": agent,
+        "simulation": simulationState,
+        "mdp": dict((attribute,getattr(mdp,attribute,None)) for attribute in mdpRunAttributes),
+        "trace": trace,
+        "statistics": statistics,
+        "random": random.getstate(),
+        "numpyRandom": np.random.get_state(),
+    }
+    temporaryPath = path+".tmp"
+    checkpointFile = open(temporaryPath,"wb")
+    try:
+        pickler = cPickle.Pickler(checkpointFile,2)
+        pickler.persistent_id = getPersistentId
+        pickler.dump(checkpoint)
+        checkpointFile.flush()
+        os.fsync(checkpointFile.fileno())
+    finally:
+        checkpointFile.close()
+    os.rename(temporaryPath,path)
+
+# Reads the checkpoint in path, with references to the MDP resolved to mdp, and restores the state of
+# mdp and of the random generators; returns the dictionary of the checkpoint
+def loadCheckpoint (path, mdp):
+    def persistentLoad (persistentId):
+        if persistentId == "instrumentation":
+            return defaultInstrumentation
+        if persistentId != "mdp":
+            raise cPickle.UnpicklingError("Unknown reference "+str(persistentId)+" in checkpoint")
+        return mdp
+    checkpointFile = open(path,"rb")
+    try:
+        unpickler = cPickle.Unpickler(checkpointFile)
+        unpickler.persistent_load = persistentLoad
+        checkpoint = unpickler.load()
+    finally:
+        checkpointFile.close()
+    for (attribute,value) in checkpoint["mdp"].items():
+        setattr(mdp,attribute,value)
+    random.setstate(checkpoint["random"])
+    np.random.set_state(checkpoint["numpyRandom"])
+    return checkpoint
+
+# Replaces the state of obj by that of saved (an object of the same class), so that references to obj
+# see the restored state
+def restoreInto (obj, saved):
+    obj.__dict__.clear()
+    obj.__dict__.update(saved.__dict__)
@@ -6,32 +6,49 @@
 from mdp import *
 import random
 import math
+import numpy as np
 
 
 # ===============================================================================================
-# class for representing the data center control as an 
+# class for representing the data center control as an
 # MDPs. Nothing here is specific to the SSB-Q-Learning algorithm whatsoever.
 # ===============================================================================================
 
+# State "sNNAA" has NN active servers and AA arrivals, action "ANN" sets the number of active servers
+# to NN for the next step, and the next number of arrivals follows a Poisson law whose rate depends
+# only on the class (low/normal/high) of the current state. The model is therefore stored in
+# factorised form: one probability mass function of arrivals per rate class, from which the
+# distribution of (state,action) is composed on demand.
 
 class DataCenterMDP (MDP):
 
-    def __init__ (self):
-        self.server = 30
+    # server: maximum number of active servers (at most 99); arrivals range from 0 to 3*server
+    # tailMass: the pmfs of arrivals are truncated (and renormalised) at the smallest number of
+    # arrivals whose upper tail has mass at most tailMass; 0 keeps all numbers of arrivals
+    def __init__ (self, server=30, tailMass=0.):
+        self.server = server
+        self.maxArrival = 3*server
+        self.tailMass = tailMass
         self.poisson = {"low": self.server/2, "normal": self.server*3/2, "high": self.server*5/2}
         self.cumulatedCost = 0
-        states = ["s"+"0"+str(i) + "0" + str(j) for i in xrange(1,10) for j in xrange(10)] + \
-                    ["s"+"0"+str(i)+str(j) for i in xrange(1,10) for j in xrange(10,91)] + \
-                    ["s"+str(i)+"0"+str(j) for i in xrange(10,31) for j in xrange(10)] + \
-                    ["s"+str(i)+str(j) for i in xrange(10,31) for j in xrange(10,91)] + ["s0"]
-        actions = ["reinit"] + ["A"+ "0" +str(i) for i in xrange(1,10)] + ["A"+str(i) for i in xrange(10,31)]
+        states = ["s%02d%02d" % (i,j) for servers in [xrange(1,10),xrange(10,server+1)] for arrivals in [xrange(10),xrange(10,self.maxArrival+1)] for i in servers for j in arrivals] + ["s0"]
+        actions = ["reinit"] + ["A%02d" % i for i in xrange(1,server+1)]
         wealthLevels = []
         finalStates = ["s0"]
-        random.seed(10)
+        # Own generator for the initial state, so as not to reseed the global one
+        generator = random.Random(10)
         #self.real_nash_equilibrium = {"w1":1./3,"w2":1./3, "w3":1./3}
-        MDP.__init__(self,states,actions,wealthLevels,self.allowedActionsFunction,finalStates,self.wealthFunction,self.transitionFunction,self.ssbFunction,random.choice(states[:-1]),"DataCenter",5)
-        self.transitionTable = {}
-        self.generateTransitionTable()
+        MDP.__init__(self,states,actions,wealthLevels,self.allowedActionsFunction,finalStates,self.wealthFunction,self.transitionFunction,self.ssbFunction,generator.choice(states[:-1]),"DataCenter",5)
+        # Structured encoding of states as (activeServers,arrivals); "s0" is encoded as (0,0)
+        self.stateEncoding = {"s0":(0,0)}
+        self.stateNames = [[None]*(self.maxArrival+1) for i in xrange(server+1)]
+        for i in xrange(1,server+1):
+            for j in xrange(self.maxArrival+1):
+                self.stateEncoding["s%02d%02d" % (i,j)] = (i,j)
+                self.stateNames[i][j] = "s%02d%02d" % (i,j)
+        self.actionServers = dict((action,int(action[1:])) for action in actions[1:])
+        self.generateArrivalDistributions()
+        self.generateCostTables()
 
     def allowedActionsFunction (self, state):
         return self.actions[1:]
@@ -39,27 +56,67 @@ class DataCenterMDP (MDP):
     def wealthFunction (self, finalState):
         pass
 
-    def generateTransitionTable(self):
-        for i in self.states[:-1]:
-            self.transitionTable[i] = {}
-            for j in self.actions[1:]:
-                self.transitionTable[i][j] = {}
-                lam = 0
-                if int(i[-1:]) < 20:
-                    lam = self.poisson["low"]
-                elif int(i[-1:]) < 40:
-                    lam = self.poisson["normal"]
-                else:
-                    lam = self.poisson["high"]
-                for nextArrival in xrange(91):
-                    if nextArrival < 10:
-                        nextArrivalStr = "0" + str(nextArrival)
-                    else:
-                        nextArrivalStr = str(nextArrival)
-                    self.transitionTable[i][j]["s"+j[1:]+nextArrivalStr] = lam**nextArrival*math.exp(-lam)/math.factorial(nextArrival)
-        return
-
-
+    # Rate class of the arrivals following state, read from the last digit of its name
+    def getRateClass (self, state):
+        if int(state[-1:]) < 20:
+            return "low"
+        elif int(state[-1:]) < 40:
+            return "normal"
+        return "high"
+
+    # Arrivals ===========================================================================
+    # arrivalPmfs[rateClass][k] is the probability of k arrivals, and (arrivalThresholds,
+    # arrivalAliases)[rateClass] its alias table (see mdp.makeAliasTable)
+    def generateArrivalDistributions (self):
+        self.arrivalPmfs = {}
+        self.arrivalThresholds = {}
+        self.arrivalAliases = {}
+        self.transitionRows = {}
+        for rateClass in ["low","normal","high"]:
+            lam = self.poisson[rateClass]
+            pmf = np.array([math.exp(k*math.log(lam)-lam-math.lgamma(k+1)) for k in xrange(self.maxArrival+1)])
+            if self.tailMass > 0:
+                tails = 1.-np.cumsum(pmf)
+                last = min(int(np.searchsorted(-tails,-self.tailMass)),self.maxArrival)
+                pmf = pmf[:last+1]/pmf[:last+1].sum()
+            self.arrivalPmfs[rateClass] = pmf
+            (self.arrivalThresholds[rateClass],self.arrivalAliases[rateClass]) = makeAliasTable(pmf)
+
+    # Distribution of next states for action from a state of given rate class, composed once
+    def getTransitionRow (self, rateClass, action):
+        key = (rateClass,action)
+        if not key in self.transitionRows:
+            names = self.stateNames[self.actionServers[action]]
+            pmf = self.arrivalPmfs[rateClass]
+            self.transitionRows[key] = dict((names[k],pmf[k]) for k in xrange(len(pmf)))
+        return self.transitionRows[key]
+
+    # Costs ============================================================================
+    # stepCostTable[servers,nextServers,arrivals] is the cost of a step from a state with servers
+    # active servers and arrivals arrivals to a state with nextServers active servers, and
+    # terminalCostTable[servers,arrivals] is the additional cost of a state ending a history
+    def generateCostTables (self):
+        servers = np.arange(self.server+1, dtype=np.float64)
+        arrivals = np.arange(self.maxArrival+1, dtype=np.float64)
+        s = servers[:,np.newaxis]
+        a = arrivals[np.newaxis,:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            congestion = np.where(a < s, a**2/s, a*(s+10*(a-s))/s)
+        congestion[0,:] = 0.
+        switching = servers[:,np.newaxis]+np.abs(servers[:,np.newaxis]-servers[np.newaxis,:])
+        self.terminalCostTable = congestion
+        self.stepCostTable = switching[:,:,np.newaxis]+congestion[:,np.newaxis,:]
+
+    def encodeState (self, state):
+        return self.stateEncoding[state]
+
+    def getStepCost (self, state, nextState):
+        (servers,arrivals) = self.stateEncoding[state]
+        return self.stepCostTable.item(servers,self.stateEncoding[nextState][0],arrivals)
+
+    def getTerminalCost (self, state):
+        (servers,arrivals) = self.stateEncoding[state]
+        return self.terminalCostTable.item(servers,arrivals)
 
     def transitionFunction (self, state, action):
         if action == "reinit":
@@ -67,10 +124,77 @@ class DataCenterMDP (MDP):
 
         if action == "stop":
             return {"s0":1.}
-        
-        return self.transitionTable[state][action]
 
-   
+        return self.getTransitionRow(self.getRateClass(state),action)
+
+    # Sampling is done on the arrival pmfs, without compiling the model
+    def drawNextState (self, state, action):
+        if action == "reinit":
+            self.counter = 0
+            return self.initialState
+        rateClass = self.getRateClass(state)
+        thresholds = self.arrivalThresholds[rateClass]
+        scaled = self.getRandomStream().random()*len(thresholds)
+        arrivals = int(scaled)
+        if scaled-arrivals >= thresholds[arrivals]:
+            arrivals = self.arrivalAliases[rateClass][arrivals]
+        return self.stateNames[self.actionServers[action]][arrivals]
+
+    # The compiled form is built block by block from the arrival pmfs: all rows of a state share
+    # the pmf of its rate class, and differ only by the number of servers of the next states
+    def buildCompiledArrays (self):
+        nbStates = len(self.states)
+        nbActions = len(self.actions)
+        reinitId = self.actionIndex["reinit"]
+        serverActionIds = np.array([self.actionIndex[action] for action in self.actions if action!="reinit"])
+        servers = np.array([self.actionServers[self.actions[actionId]] for actionId in serverActionIds])
+        stateIds = np.array([[self.stateIndex.get(name,-1) if name is not None else -1 for name in names] for names in self.stateNames], dtype=np.int32)
+        rowLengths = np.zeros((nbStates,nbActions), dtype=np.int64)
+        rowLengths[:,reinitId] = 1
+        rateClasses = [self.getRateClass(state) for state in self.states]
+        for stateId in xrange(nbStates):
+            rowLengths[stateId,serverActionIds] = len(self.arrivalPmfs[rateClasses[stateId]])
+        rowOffsets = np.zeros(nbStates*nbActions+1, dtype=np.int64)
+        np.cumsum(rowLengths.ravel(), out=rowOffsets[1:])
+        nextStateIds = np.empty(rowOffsets[-1], dtype=np.int32)
+        probabilities = np.empty(rowOffsets[-1])
+        initialStateId = self.stateIndex[self.initialState]
+        for stateId in xrange(nbStates):
+            pmf = self.arrivalPmfs[rateClasses[stateId]]
+            start = rowOffsets[stateId*nbActions]
+            end = rowOffsets[(stateId+1)*nbActions]
+            # Actions are "reinit" followed by the server actions, in this order
+            nextStateIds[start] = initialStateId
+            probabilities[start] = 1.
+            nextStateIds[start+1:end] = stateIds[servers,:len(pmf)].ravel()
+            probabilities[start+1:end] = np.tile(pmf,len(servers))
+        self.rowOffsets = rowOffsets
+        self.nextStateIds = nextStateIds
+        self.probabilities = probabilities
+
+    def getModelParameters (self):
+        parameters = MDP.getModelParameters(self)
+        parameters.update({"server":self.server, "tailMass":self.tailMass})
+        return parameters
+
+    def buildAliasTables (self):
+        if self.aliasThresholds is not None:
+            return self
+        self.compile()
+        nbActions = len(self.actions)
+        thresholds = np.ones(len(self.probabilities))
+        aliasEntries = np.arange(len(self.probabilities), dtype=np.int64)
+        for stateId in xrange(len(self.states)):
+            rateClass = self.getRateClass(self.states[stateId])
+            size = len(self.arrivalPmfs[rateClass])
+            starts = self.rowOffsets[stateId*nbActions+1:(stateId+1)*nbActions]
+            thresholds[starts[0]:starts[-1]+size] = np.tile(self.arrivalThresholds[rateClass],len(starts))
+            aliasEntries[starts[0]:starts[-1]+size] = (starts[:,np.newaxis]+self.arrivalAliases[rateClass][np.newaxis,:]).ravel()
+        self.aliasThresholds = thresholds
+        self.aliasEntries = aliasEntries
+        return self
+
+
     def ssbFunction():
         pass
 
@@ -81,8 +205,9 @@ class DataCenterMDP (MDP):
 
 def main():
     mdp = DataCenterMDP()
-    print(mdp.transitionTable)
+    for rateClass in ["low","normal","high"]:
+        print rateClass, mdp.arrivalPmfs[rateClass]
 
 if __name__ == "__main__":
     main()
-        
+
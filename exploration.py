@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import numpy as np
+
+from instrumentation import *
+
+# ===============================================================================================
+# Exploration strategies of the learners other than epsilon-greedy ones, selected by the strategy
+# attribute of a learner:
+#
+# - "boltzmann": action drawn with probability proportional to exp(Q/temperature), computed with the
+#   log-sum-exp trick (no overflow whatever the scale of Q values) and drawn with one searchsorted
+# - "ucb": greedy action for Q plus a bonus ucbCoefficient*sqrt(log(n(s))/n(s,a)), n being the numbers
+#   of visits and experiences; actions never experienced in a state are chosen first
+#
+# Learners are used through getQValue, getNbVisits, getNbExperiences, getMaxQValue, their random
+# stream (see rng) and their instrumentation; a choice
+# of a non greedy action is counted in nbEpsilons, as an exploration.
+# ===============================================================================================
+
+# Probabilities exp(values/temperature), normalised
+def softmax (values, temperature):
+    scaled = np.asarray(values, dtype=np.float64)/temperature
+    logNormaliser = scaled.max()
+    logNormaliser += np.log(np.exp(scaled-logNormaliser).sum())
+    return np.exp(scaled-logNormaliser)
+
+# Index drawn according to (possibly unnormalised) probabilities, given a uniform draw in [0,1)
+def drawIndex (probabilities, uniform):
+    cumulated = np.cumsum(probabilities)
+    return min(int(np.searchsorted(cumulated,uniform*cumulated[-1])), len(cumulated)-1)
+
+# Q values plus exploration bonuses; infinite for actions never experienced
+def ucbScores (values, nbExperiences, nbVisits, coefficient):
+    values = np.asarray(values, dtype=np.float64)
+    nbExperiences = np.asarray(nbExperiences, dtype=np.float64)
+    scores = np.empty(len(values))
+    scores.fill(np.inf)
+    experienced = nbExperiences > 0
+    scores[experienced] = values[experienced]+coefficient*np.sqrt(np.log(max(nbVisits,1))/nbExperiences[experienced])
+    return scores
+
+def getQValueArray (learner, state, actions):
+    return np.array([learner.getQValue(state,action) for action in actions], dtype=np.float64)
+
+def countExploration (learner, state, action):
+    if learner.getQValue(state,action) < learner.getMaxQValue(state):
+        learner.nbEpsilons += 1
+    else:
+        learner.nbExploitations += 1
+
+def chooseBoltzmannAction (learner, state, actions):
+    probabilities = softmax(getQValueArray(learner,state,actions),learner.temperature)
+    if learner.instrumentation.debugging:
+        learner.instrumentation.debug(dict(zip(actions,probabilities.tolist())))
+    action = actions[drawIndex(probabilities,learner.randomStream.random())]
+    countExploration(learner,state,action)
+    return action
+
+def chooseUCBAction (learner, state, actions):
+    nbExperiences = [learner.getNbExperiences(state,action) for action in actions]
+    scores = ucbScores(getQValueArray(learner,state,actions),nbExperiences,learner.getNbVisits(state),learner.ucbCoefficient)
+    action = actions[learner.randomStream.choice(np.flatnonzero(scores == scores.max()).tolist())]
+    countExploration(learner,state,action)
+    return action
+
+explorationStrategies = {
+    "boltzmann": chooseBoltzmannAction,
+    "ucb": chooseUCBAction,
+}
@@ -17,15 +17,17 @@ import random
 
 class GarnetsMDP (MDP):
 
-    def __init__ (self):
+    # seed: seed from which the transition table is generated
+    def __init__ (self, seed=8):
+        self.seed = seed
         states = ["s"+"0"+str(i) for i in xrange(10)] + ["s"+str(i) for i in xrange(10,100)]
         actions = ["reinit"] + ["A"+str(i) for i in xrange(1,6)]
         wealthLevels = ["w"+str(i) for i in xrange(1,21)]
         finalStates = ["s" + str(i) for i in xrange(80,100)]
         #self.real_nash_equilibrium = {"w1":1./3,"w2":1./3, "w3":1./3}
         MDP.__init__(self,states,actions,wealthLevels,self.allowedActionsFunction,finalStates,self.wealthFunction,self.transitionFunction,self.ssbFunction,"s00","Garnets",50)
-        self.transitionTable = {}
-        self.generateTransitionTable()
+        # Generated on first use, so that a model read from the model cache is not generated
+        self.transitionTable = None
 
     def allowedActionsFunction (self, state):
         if state in self.finalStates:
@@ -40,8 +42,16 @@ class GarnetsMDP (MDP):
     def wealthFunction (self, finalState):
         return "w" + str(int(finalState[1:])-79)
 
+    # Returns the transition table, generated if not yet done
+    def getTransitionTable (self):
+        if self.transitionTable is None:
+            self.generateTransitionTable()
+        return self.transitionTable
+
     def generateTransitionTable(self):
-        random.seed(8)
+        self.transitionTable = {}
+        # Own generator, so as not to reseed the global one
+        generator = random.Random(self.seed)
         realState = self.states[:]
         for i in self.states[:-20]:
             realState = self.states[:]
@@ -51,11 +61,11 @@ class GarnetsMDP (MDP):
                 self.transitionTable[i][j] = {}
                 pRest = 1
                 for k in xrange(7):
-                    nextState = random.choice(realState)
+                    nextState = generator.choice(realState)
                     while nextState in self.transitionTable[i][j].keys():
-                        nextState = random.choice(realState)
+                        nextState = generator.choice(realState)
                     if k < 6:
-                        p = random.uniform(0,pRest)
+                        p = generator.uniform(0,pRest)
                         pRest -= p
                     else:
                         p = pRest
@@ -64,11 +74,16 @@ class GarnetsMDP (MDP):
 
 
 
+    def getModelParameters (self):
+        parameters = MDP.getModelParameters(self)
+        parameters["seed"] = self.seed
+        return parameters
+
     def transitionFunction (self, state, action):
         if action == "reinit":
             return {"s00":1.}
 
-        return self.transitionTable[state][action]
+        return self.getTransitionTable()[state][action]
 
    
     def ssbFunction():
@@ -81,7 +96,7 @@ class GarnetsMDP (MDP):
 
 def main():
     mdp = GarnetsMDP()
-    print(mdp.transitionTable)
+    print(mdp.getTransitionTable())
 
 if __name__ == "__main__":
     main()
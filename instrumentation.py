@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import sys
+import time
+
+# ===============================================================================================
+# Leveled logging and counters for simulations. Messages have a level (DEBUG for every step,
+# INFO for observation points, WARNING) and are written to every sink of the instrumentation whose
+# level they reach. Call sites test the booleans debugging/informing before building a message, so
+# that disabled levels cost one attribute test. Counters of steps, episodes and explorations give
+# the rates of a run (steps and episodes per second, exploration ratio).
+#
+# defaultInstrumentation is used by the simulation and the learners unless told otherwise; set its
+# level to SILENT for silent runs.
+# ===============================================================================================
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+SILENT = 100
+
+levelNames = {DEBUG:"DEBUG", INFO:"INFO", WARNING:"WARNING"}
+
+# Writes messages to a stream (the standard output by default)
+class StreamSink ():
+
+    def __init__ (self, stream=None):
+        self.stream = stream
+
+    def write (self, level, message):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(message+"\n")
+
+# Appends messages, prefixed by their level and time, to a file
+class FileSink ():
+
+    def __init__ (self, path):
+        self.file = open(path,"a")
+
+    def write (self, level, message):
+        self.file.write("%s %s %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"),levelNames[level],message))
+        self.file.flush()
+
+# Keeps messages as a list of pairs (level,message)
+class ListSink ():
+
+    def __init__ (self):
+        self.messages = []
+
+    def write (self, level, message):
+        self.messages.append((level,message))
+
+
+class Instrumentation ():
+
+    def __init__ (self, level=INFO, sinks=None):
+        if sinks is None:
+            sinks = [StreamSink()]
+        self.sinks = sinks
+        self.setLevel(level)
+        self.startRun()
+
+    def setLevel (self, level):
+        self.level = level
+        self.debugging = level <= DEBUG
+        self.informing = level <= INFO
+
+    def log (self, level, *values):
+        if level < self.level:
+            return
+        message = " ".join(str(value) for value in values)
+        for sink in self.sinks:
+            sink.write(level,message)
+
+    def debug (self, *values):
+        self.log(DEBUG,*values)
+
+    def info (self, *values):
+        self.log(INFO,*values)
+
+    def warning (self, *values):
+        self.log(WARNING,*values)
+
+    # Counters ========================================================================
+
+    def startRun (self):
+        self.startTime = time.time()
+        self.nbSteps = 0
+        self.nbEpisodes = 0
+        self.nbExplorations = 0
+
+    # Sets the counters of the current run (called by the simulation at observation points)
+    def updateCounters (self, nbSteps, nbEpisodes, nbExplorations):
+        self.nbSteps = nbSteps
+        self.nbEpisodes = nbEpisodes
+        self.nbExplorations = nbExplorations
+
+    def getElapsedTime (self):
+        return time.time()-self.startTime
+
+    def getStepsPerSecond (self):
+        return self.nbSteps/max(self.getElapsedTime(),1e-9)
+
+    def getEpisodesPerSecond (self):
+        return self.nbEpisodes/max(self.getElapsedTime(),1e-9)
+
+    def getExplorationRatio (self):
+        if self.nbSteps == 0:
+            return 0.
+        return self.nbExplorations/float(self.nbSteps)
+
+    # Returns the counters and rates of the current run, as a dictionary
+    def getCounters (self):
+        return {"steps":self.nbSteps, "episodes":self.nbEpisodes, "explorations":self.nbExplorations, "elapsedTime":self.getElapsedTime(), "stepsPerSecond":self.getStepsPerSecond(), "episodesPerSecond":self.getEpisodesPerSecond(), "explorationRatio":self.getExplorationRatio()}
+
+    def reportCounters (self):
+        if self.informing:
+            self.info("steps/s","%0.1f" % self.getStepsPerSecond(),"episodes/s","%0.1f" % self.getEpisodesPerSecond(),"exploration ratio","%0.3f" % self.getExplorationRatio())
+
+
+defaultInstrumentation = Instrumentation()
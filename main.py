@@ -18,6 +18,7 @@ from qqlearning import *
 from qlearning import *
 from observation import *
 from simulation import *
+from analytics import *
 import matplotlib.pyplot as plt
 
 # Main functions ===========================================================
@@ -29,6 +30,7 @@ def printUsageAndExit ():
     print "mdpType"
     print "tau: should be in [0,1]"
     print "optional: input <compare> to compare the performance of standard Q and QQ learning"
+    print "optional: input <cache=directory> to read the compiled MDP from the model cache in directory (written there if absent)"
     sys.exit(1)
 
 def plotResults(agent, nbSteps, step):
@@ -36,13 +38,14 @@ def plotResults(agent, nbSteps, step):
         print '--------------------------------------'
         print 'Here is the vector of wealth frequancies when exploiting and exploring: '
         print i.real_wealth_frequencies
+        print 'Estimated tau-quantile of the returns of histories: ', i.returnQuantile.getValue()
         print '--------------------------------------'
         
         if not i.mdp.mdpType == "DataCenter" and not i.mdp.mdpType == "Garnets":
             n =  i.mdp.getWealthLevels()
             for w in n:
                 print i.getCurrentRewardWealthLevel(w)
-            print sum(i.getCurrentRewardWealthLevel(w)*i.real_wealth_frequencies[w] for w in n)
+            print i.getExpectedReward()
               
             plt.figure()
             #nbSteps = 20000000
@@ -66,7 +69,7 @@ def plotResults(agent, nbSteps, step):
         plt.figure()
         plt.title(str(i.initTheta)+" "+str(i.constant))
         np.save(str(agent.index(i))+"Theta.npy", i.theta)
-        plt.plot(i.thetas)
+        plt.plot(*i.thetas.getSeries())
         plt.ylabel(ur"$\theta$")
         plt.xlabel('learning steps')
         plt.xlim((-20000,nbSteps))
@@ -78,31 +81,11 @@ def plotResults(agent, nbSteps, step):
 
 def plotResultsQ(agent,agentQ):
     plt.figure()
-    plotDataset = [[],[]]
-    agent.histories = [i/100. for i in agent.histories[-10000:]]
-    history = list(set(agent.histories))
-    history.sort()
-    count = len(agent.histories)
-    cumNum = 0
-    for data in history:
-        cumNum += agent.histories.count(data)
-        if data > 0:
-            plotDataset[0].append(data)
-            plotDataset[1].append(float(cumNum)/count)
-    plt.plot(plotDataset[0],plotDataset[1],label="QQ-learning")
-    plotDataset = [[],[]]
-
-    agentQ.histories = [i/100. for i in agentQ.histories[-10000:]]
-    history = list(set(agentQ.histories))
-    history.sort()
-    count = len(agentQ.histories)
-    cumNum = 0
-    for data in history:
-        cumNum += agentQ.histories.count(data)
-        if data > 0:
-            plotDataset[0].append(data)
-            plotDataset[1].append(float(cumNum)/count)
-    plt.plot(plotDataset[0],plotDataset[1],label="Standard Q-learning")
+    (history,cdf) = empiricalCDF(np.array(agent.histories.getTail())/100.)
+    plt.plot(history[history > 0],cdf[history > 0],label="QQ-learning")
+
+    (history,cdf) = empiricalCDF(np.array(agentQ.histories.getTail())/100.)
+    plt.plot(history[history > 0],cdf[history > 0],label="Standard Q-learning")
     plt.legend(loc=0)
     plt.ylabel("cumulated probability")
     plt.xlabel("wealth for histories")
@@ -207,9 +190,16 @@ elif sys.argv[4]=="datacenter":
 else:
     printUsageAndExit()
 
-if len(sys.argv) > 6:
-    if sys.argv[6] == "compare":
+cacheDirectory = None
+for argument in sys.argv[6:]:
+    if argument == "compare":
         compare = True
+    elif argument.startswith("cache="):
+        cacheDirectory = argument[len("cache="):]
+    else:
+        printUsageAndExit()
+if cacheDirectory is not None:
+    mdp.compile(cacheDirectory)
 
 # Simulating ==================================================================
 
@@ -4,6 +4,12 @@
 """
 
 import random 
+import collections
+import hashlib
+import numpy as np
+
+from modelcache import loadCompiledModel, saveCompiledModel, getSourceDigest
+from rng import *
 
 # ===============================================================================================
 # A class defining a generic "SSB MDP". Nothing here is specific to Gardner's dice or the
@@ -18,7 +24,8 @@ class MDP ():
     # wealthFunction: function from final state to wealthLevel
     # transitionFunction: function from state, action to dictionary (nextState,probability)
     # ssbFunction: function from wealthLevel, otherWealthLevel to number
-    def __init__ (self, states, actions, wealthLevels, allowedActionsFunction, finalStates, wealthFunction, transitionFunction, ssbFunction, initialState, mdpType, horizon):
+    # horizon: maximum number of actions in one history (None if unbounded)
+    def __init__ (self, states, actions, wealthLevels, allowedActionsFunction, finalStates, wealthFunction, transitionFunction, ssbFunction, initialState, mdpType, horizon=None):
         self.states = states
         self.actions = actions
         self.wealthLevels = wealthLevels
@@ -32,6 +39,26 @@ class MDP ():
         self.counter = 0
         #horizon defines the maximum num of actions can be taken in one history
         self.horizon = horizon
+        self.setTransitionCache()
+        # Compiled (integer-indexed) form, built on demand by compile()
+        self.stateIndex = None
+        self.actionIndex = None
+        self.wealthLevelIndex = None
+        self.rowOffsets = None
+        self.nextStateIds = None
+        self.probabilities = None
+        self.allowedMask = None
+        self.finalMask = None
+        self.wealthIds = None
+        self.entryRowIds = None
+        self.aliasThresholds = None
+        self.aliasEntries = None
+        # Values of the last call to solveMDP, used for warm starts
+        self.solvedValues = None
+        # Random stream from which next states are drawn (see rng and setSeed); without setSeed, it is
+        # created by the first draw (see getRandomStream), so that building an MDP does not change the
+        # global generator of the random module
+        self.randomStream = None
 
 
     def getStates (self):
@@ -61,57 +88,320 @@ class MDP ():
     def getWealthLevel (self, finalState):
         return self.wealthFunction(finalState)
 
-    # Returns a dictionary (nextState,probability)
+    # Returns a dictionary (nextState,probability), which is memoized (see setTransitionCache)
+    # and hence must not be modified
     def getDistribution (self, state, action):
-        return self.transitionFunction(state,action)
+        key = (state,action)
+        if key in self.transitionCache:
+            if self.maxCacheSize is not None:
+                self.transitionCache[key] = self.transitionCache.pop(key)
+            return self.transitionCache[key]
+        distribution = self.transitionFunction(state,action)
+        self.transitionCache[key] = distribution
+        if self.maxCacheSize is not None and len(self.transitionCache) > self.maxCacheSize:
+            self.transitionCache.popitem(last=False)
+        return distribution
 
     def getProbability (self, state, action, nextState):
-        if not nextState in self.transitionFunction(state,action).keys():
-            return 0.
-        return self.transitionFunction(state,action)[nextState]
+        return self.getDistribution(state,action).get(nextState,0.)
+
+    # Distributions returned by getDistribution are memoized by (state,action). With maxSize, only
+    # the maxSize most recently used ones are kept (for very large models); the cache is emptied.
+    def setTransitionCache (self, maxSize=None):
+        self.maxCacheSize = maxSize
+        if maxSize is None:
+            self.transitionCache = {}
+        else:
+            self.transitionCache = collections.OrderedDict()
+
+    # Fills the transition cache with the distributions of all allowed actions and of "reinit"; a
+    # bounded cache (see setTransitionCache) is only filled up to its size
+    def precomputeTransitions (self):
+        for state in self.states:
+            for action in self.getAllowedActions(state)+["reinit"]:
+                if self.maxCacheSize is not None and len(self.transitionCache) >= self.maxCacheSize:
+                    return
+                distribution = self.getRawDistribution(state,action)
+                if distribution:
+                    self.transitionCache[(state,action)] = distribution
+
+    # Reseeds the random stream from which next states are drawn
+    def setSeed (self, seed):
+        self.randomStream = RandomStream(seed,"mdp")
+
+    # Random stream from which next states are drawn; if not seeded by setSeed, its seed is drawn from
+    # the global generator of the random module at the first draw
+    def getRandomStream (self):
+        if self.randomStream is None:
+            self.randomStream = RandomStream(None,"mdp")
+        return self.randomStream
 
     def drawNextState (self, state, action):
         if action == "reinit":
             self.counter = 0
-        distribution = self.transitionFunction(state,action)
-        randomNumber = random.random()
-        mass = 0
-        for nextState in distribution.keys():
-            probability = distribution[nextState]
-            mass = mass+probability
-            if randomNumber <= mass:
-                return nextState
+        self.buildAliasTables()
+        nextStateId = self.drawNextStateId(self.stateIndex[state],self.actionIndex[action],self.getRandomStream().random())
+        return self.states[nextStateId]
 
     # Returns phi(wealthLevel,otherWealthLevel), where phi is the SSB utility function
     def getPreference (self, wealthLevel, otherWealthLevel):
         return self.ssbFunction(wealthLevel,otherWealthLevel)
 
-    def solveMDP(self,reward):
+    # Returns the optimal expected reward from the initial state, for reward given as a dictionary
+    # (finalState,reward). Bellman backups are run on all states at once over the compiled form,
+    # until no value moves by more than tolerance. With policyIteration, the greedy policy is
+    # instead evaluated exactly at each iteration. Values of the previous call are used as a
+    # starting point, since successive calls (one per observation) differ by small reward changes.
+    def solveMDP (self, reward, tolerance=1e-9, policyIteration=False, maxIterations=100000):
         k = 0
         for value in reward.values():
             if value == 1:
                 k += 1
         if k == len(reward):
             return 1
-        values = {}
-        for state in self.getStates():
-            if self.isFinal(state):
-                values[state] = reward[state]
+        self.compile()
+        finalIds = np.flatnonzero(self.finalMask)
+        finalRewards = np.array([reward[self.states[stateId]] for stateId in finalIds], dtype=np.float64)
+        if self.solvedValues is not None:
+            values = self.solvedValues.copy()
+        else:
+            values = np.zeros(len(self.states))
+        values[finalIds] = finalRewards
+        if policyIteration:
+            values = self.solveByPolicyIteration(values, tolerance, maxIterations)
+        else:
+            values = self.solveByValueIteration(values, tolerance, maxIterations)
+        self.solvedValues = values
+        return values[self.stateIndex[self.initialState]]
+
+    def solveByValueIteration (self, values, tolerance, maxIterations):
+        nonFinal = ~self.finalMask
+        for iteration in xrange(maxIterations):
+            newValues = self.getCompiledQValues(values).max(axis=1)
+            delta = np.abs(newValues[nonFinal]-values[nonFinal]).max()
+            values[nonFinal] = newValues[nonFinal]
+            if delta <= tolerance:
+                break
+        return values
+
+    def solveByPolicyIteration (self, values, tolerance, maxIterations):
+        nonFinalIds = np.flatnonzero(~self.finalMask)
+        position = np.empty(len(self.states), dtype=np.int64)
+        position.fill(-1)
+        position[nonFinalIds] = np.arange(len(nonFinalIds))
+        nbActions = len(self.actions)
+        rowIds = self.getEntryRowIds()
+        policy = None
+        for iteration in xrange(maxIterations):
+            qValues = self.getCompiledQValues(values)[nonFinalIds]
+            greedy = qValues.argmax(axis=1)
+            if policy is not None:
+                # Keep the current action when it is still optimal, so as to avoid cycling among ties
+                current = qValues[np.arange(len(nonFinalIds)),policy]
+                stable = current >= qValues.max(axis=1)-tolerance
+                if stable.all():
+                    break
+                policy = np.where(stable, policy, greedy)
             else:
-                values[state] = 0
-        converged = False 
-        while(converged is False):
-            delta = 0
-            for state in self.getStates():
-                if not(self.isFinal(state)):
-                    nv = -1000
-                    for action in self.getAllowedActions(state):
-                        Q = 0
-                        for new_state,prob in self.transitionFunction( state, action).items():
-                            Q += prob*values[new_state]
-                        nv = max(nv,Q)
-                    delta = max(delta, abs(values[state] - nv))
-                    values[state] = nv
-            if delta == 0:
-                converged = True
-        return values[self.initialState] 
+                policy = greedy
+            # Exact evaluation: (I-P_nn)v_n = P_nf.v_f over non final states
+            isPolicyEntry = np.zeros(len(self.rowOffsets)-1, dtype=bool)
+            isPolicyEntry[nonFinalIds*nbActions+policy] = True
+            entries = isPolicyEntry[rowIds]
+            fromIds = position[rowIds[entries]//nbActions]
+            toIds = self.nextStateIds[entries]
+            entryProbabilities = self.probabilities[entries]
+            toNonFinal = position[toIds]>=0
+            matrix = np.eye(len(nonFinalIds))
+            np.add.at(matrix, (fromIds[toNonFinal],position[toIds[toNonFinal]]), -entryProbabilities[toNonFinal])
+            constant = np.bincount(fromIds[~toNonFinal], weights=entryProbabilities[~toNonFinal]*values[toIds[~toNonFinal]], minlength=len(nonFinalIds))
+            try:
+                values[nonFinalIds] = np.linalg.solve(matrix,constant)
+            except np.linalg.LinAlgError:
+                # Improper policy (never reaches a final state): fall back to value iteration
+                return self.solveByValueIteration(values, tolerance, maxIterations)
+        return values
+
+    # Compiled form ===================================================================================
+    # States, actions and wealth levels are given dense integer ids (their position in the
+    # corresponding lists). Every (state,action) distribution is packed in CSR style: the row
+    # of (stateId,actionId) is stateId*nbActions+actionId, and its successors are
+    # nextStateIds[rowOffsets[row]:rowOffsets[row+1]], with the matching probabilities.
+    # Rows are filled for allowed actions and for "reinit" (which the learners may force in
+    # any state); all other rows are empty.
+
+    # Ids, allowed-action and final-state masks and wealth level ids of final states; these do not
+    # need the transitions, hence are much cheaper than compile()
+    def buildIndex (self):
+        if self.stateIndex is not None:
+            return self
+        self.stateIndex = dict((state,i) for (i,state) in enumerate(self.states))
+        self.actionIndex = dict((action,i) for (i,action) in enumerate(self.actions))
+        self.wealthLevelIndex = dict((wealthLevel,i) for (i,wealthLevel) in enumerate(self.wealthLevels))
+        finalStates = set(self.finalStates)
+        self.allowedMask = np.zeros((len(self.states),len(self.actions)), dtype=bool)
+        self.finalMask = np.zeros(len(self.states), dtype=bool)
+        self.wealthIds = np.empty(len(self.states), dtype=np.int32)
+        self.wealthIds.fill(-1)
+        for stateId in xrange(len(self.states)):
+            state = self.states[stateId]
+            if state in finalStates:
+                self.finalMask[stateId] = True
+                wealthLevel = self.wealthFunction(state)
+                if wealthLevel in self.wealthLevelIndex:
+                    self.wealthIds[stateId] = self.wealthLevelIndex[wealthLevel]
+            for action in self.getAllowedActions(state):
+                self.allowedMask[stateId,self.actionIndex[action]] = True
+        return self
+
+    def isCompiled (self):
+        return self.rowOffsets is not None
+
+    # Distribution read when compiling; pairs for which the model defines nothing give empty rows
+    def getRawDistribution (self, state, action):
+        try:
+            distribution = self.transitionFunction(state,action)
+        except KeyError:
+            return {}
+        if distribution is None:
+            return {}
+        return distribution
+
+    # With cacheDirectory, the compiled form is read from the model cache (see modelcache) when
+    # it holds this model, and written to it otherwise
+    def compile (self, cacheDirectory=None):
+        if self.isCompiled():
+            return self
+        self.buildIndex()
+        if cacheDirectory is not None and loadCompiledModel(self,cacheDirectory):
+            return self
+        self.buildCompiledArrays()
+        if cacheDirectory is not None:
+            saveCompiledModel(self,cacheDirectory)
+        return self
+
+    # Parameters which, together with the type of the MDP, determine its compiled form; used as the
+    # key of the model cache. They include the lists defining the MDP and a digest of the code of its
+    # class (see modelcache), so that a change to a transition function gives another key. Models
+    # generated with a seed or from parameters must extend them.
+    def getModelParameters (self):
+        lists = repr((self.states,self.actions,self.wealthLevels,self.finalStates))
+        return {"mdpType":self.mdpType, "nbStates":len(self.states), "nbActions":len(self.actions), "initialState":self.initialState,
+                "lists":hashlib.sha1(lists).hexdigest(), "source":getSourceDigest(self)}
+
+    def buildCompiledArrays (self):
+        nbStates = len(self.states)
+        nbActions = len(self.actions)
+        rowOffsets = np.zeros(nbStates*nbActions+1, dtype=np.int64)
+        nextStateIds = []
+        probabilities = []
+        for stateId in xrange(nbStates):
+            state = self.states[stateId]
+            for actionId in xrange(nbActions):
+                action = self.actions[actionId]
+                if self.allowedMask[stateId,actionId] or action=="reinit":
+                    for (nextState,probability) in self.getRawDistribution(state,action).items():
+                        if probability!=0:
+                            nextStateIds.append(self.stateIndex[nextState])
+                            probabilities.append(probability)
+                rowOffsets[stateId*nbActions+actionId+1] = len(nextStateIds)
+        self.nextStateIds = np.array(nextStateIds, dtype=np.int32)
+        self.probabilities = np.array(probabilities, dtype=np.float64)
+        self.rowOffsets = rowOffsets
+
+    def getRowId (self, stateId, actionId):
+        return stateId*len(self.actions)+actionId
+
+    # Returns the arrays (nextStateIds,probabilities) of the compiled distribution of (stateId,actionId)
+    def getCompiledRow (self, stateId, actionId):
+        row = self.getRowId(stateId,actionId)
+        start = self.rowOffsets[row]
+        end = self.rowOffsets[row+1]
+        return self.nextStateIds[start:end], self.probabilities[start:end]
+
+    # Row of each entry of the compiled arrays
+    def getEntryRowIds (self):
+        if self.entryRowIds is None:
+            self.compile()
+            self.entryRowIds = np.repeat(np.arange(len(self.rowOffsets)-1), np.diff(self.rowOffsets))
+        return self.entryRowIds
+
+    # Returns the array of expected values of next states, indexed by [stateId,actionId], given values
+    # indexed by stateId; actions which are not allowed get -infinity
+    def getCompiledQValues (self, values):
+        expectations = np.bincount(self.getEntryRowIds(), weights=self.probabilities*values[self.nextStateIds], minlength=len(self.rowOffsets)-1)
+        expectations = expectations.reshape(len(self.states),len(self.actions))
+        return np.where(self.allowedMask, expectations, -np.inf)
+
+    # Sampling ========================================================================================
+    # Each compiled row gets an alias table (Walker, built with Vose's method): entry e of a row of
+    # n entries is drawn with probability 1/n, then kept with probability aliasThresholds[e] and
+    # otherwise replaced by entry aliasEntries[e] of the same row. A draw thus costs constant time.
+
+    def buildAliasTables (self):
+        if self.aliasThresholds is not None:
+            return self
+        self.compile()
+        thresholds = np.ones(len(self.probabilities))
+        aliasEntries = np.arange(len(self.probabilities), dtype=np.int64)
+        for row in xrange(len(self.rowOffsets)-1):
+            start = self.rowOffsets[row]
+            end = self.rowOffsets[row+1]
+            if end-start<=1:
+                continue
+            (rowThresholds,rowAliases) = makeAliasTable(self.probabilities[start:end])
+            thresholds[start:end] = rowThresholds
+            aliasEntries[start:end] = start+rowAliases
+        self.aliasThresholds = thresholds
+        self.aliasEntries = aliasEntries
+        return self
+
+    # Draws the id of a next state given a uniform number in [0,1)
+    def drawNextStateId (self, stateId, actionId, uniform):
+        row = self.getRowId(stateId,actionId)
+        start = self.rowOffsets[row]
+        size = self.rowOffsets[row+1]-start
+        if size==0:
+            raise ValueError("No distribution for action "+self.actions[actionId]+" in state "+self.states[stateId])
+        scaled = uniform*size
+        entry = start+int(scaled)
+        if scaled-int(scaled) < self.aliasThresholds[entry]:
+            return self.nextStateIds[entry]
+        return self.nextStateIds[self.aliasEntries[entry]]
+
+    # Batch version of drawNextStateId, for arrays of state ids, action ids and uniform numbers
+    def drawNextStateIds (self, stateIds, actionIds, uniforms):
+        self.buildAliasTables()
+        rows = np.asarray(stateIds)*len(self.actions)+np.asarray(actionIds)
+        starts = self.rowOffsets[rows]
+        sizes = self.rowOffsets[rows+1]-starts
+        if (sizes==0).any():
+            raise ValueError("No distribution for some of the given (state,action) pairs")
+        scaled = np.asarray(uniforms)*sizes
+        offsets = scaled.astype(np.int64)
+        entries = starts+offsets
+        kept = (scaled-offsets) < self.aliasThresholds[entries]
+        return np.where(kept, self.nextStateIds[entries], self.nextStateIds[self.aliasEntries[entries]])
+
+
+# Alias table of a distribution given as an array of n probabilities (not necessarily normalised),
+# built with Vose's method: returns the arrays (thresholds,aliases) such that drawing i uniformly,
+# then keeping it with probability thresholds[i] and taking aliases[i] otherwise, follows the
+# distribution
+def makeAliasTable (probabilities):
+    n = len(probabilities)
+    thresholds = np.ones(n)
+    aliases = np.arange(n, dtype=np.int64)
+    scaled = (np.asarray(probabilities, dtype=np.float64)*(n/float(np.sum(probabilities)))).tolist()
+    small = [i for i in xrange(n) if scaled[i]<1.]
+    large = [i for i in xrange(n) if scaled[i]>=1.]
+    while small and large:
+        less = small.pop()
+        more = large[-1]
+        thresholds[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] = scaled[more]+scaled[less]-1.
+        if scaled[more]<1.:
+            small.append(large.pop())
+    # Entries left in either list have (up to rounding) probability exactly 1/n
+    return thresholds, aliases
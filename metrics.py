@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import collections
+import os
+import tempfile
+
+import numpy as np
+
+from rng import *
+
+# ===============================================================================================
+# Recorders of the metrics which learners append to along a run (theta at every step, wealth of
+# every history). A MetricRecorder is appended values like a list, and keeps a summary of them
+# according to its mode:
+#
+# - "full": all values (memory grows with the run)
+# - "decimate": one value every stride values, the stride doubling whenever capacity values are kept
+# - "buckets": min, max and mean of consecutive buckets of values, neighbouring buckets being merged
+#   (and the size of buckets doubled) whenever there are capacity buckets; capacity must be even
+# - "reservoir": a uniform sample of capacity values (with their indices)
+#
+# In all modes the last tailSize values are kept, and if spillPath is not None, all values are also
+# written to that file as raw float64 (read back with readSpill), by chunks of chunkSize values; the
+# last chunk is written by close (or flush). With spillDirectory instead, the file is a new one of
+# that directory, named spillName-XXXXXX.f64 with a unique suffix. The file is only created (or
+# truncated) when the first chunk is written, so that recorders which never write (such as those of
+# a learner whose state is then replaced by a checkpoint) leave no file.
+# Apart from the "full" mode, the memory used does not depend on the number of values. Values must
+# be numbers (learners record wealth levels by their rank), or, in "full" and "decimate" modes without
+# spilling, arrays of the same shape (such as the thetas of all batched learners at one step).
+# ===============================================================================================
+
+metricModes = ["full", "decimate", "buckets", "reservoir"]
+
+class MetricRecorder ():
+
+    def __init__ (self, mode="full", capacity=10000, tailSize=10000, spillPath=None, chunkSize=65536, seed=None, spillDirectory=None, spillName="metric"):
+        if not mode in metricModes:
+            raise ValueError("Unknown metric mode "+str(mode))
+        if mode == "buckets" and (capacity < 2 or capacity%2 != 0):
+            raise ValueError("The capacity of buckets mode must be even and at least 2, not "+str(capacity))
+        self.mode = mode
+        self.capacity = capacity
+        self.count = 0
+        self.tail = collections.deque(maxlen=tailSize)
+        # Full and reservoir modes: values and their indices; decimate mode: kept values, one every stride
+        self.values = []
+        self.indices = []
+        self.stride = 1
+        # Buckets mode: closed buckets, and the one being filled
+        self.bucketSize = 1
+        self.bucketStarts = []
+        self.bucketMins = []
+        self.bucketMaxs = []
+        self.bucketSums = []
+        self.bucketCounts = []
+        self.currentBucket = None
+        # Reservoir mode: own random stream (see rng), so that sampling does not change the runs of
+        # learners
+        self.randomStream = RandomStream(seed,"metrics")
+        # Spill file, written by chunks, and opened by the first one
+        self.spilling = spillPath is not None or spillDirectory is not None
+        self.spillPath = spillPath
+        self.spillDirectory = spillDirectory
+        self.spillName = spillName
+        self.chunkSize = chunkSize
+        self.chunk = []
+        self.nbSpilled = 0
+        self.spillFile = None
+
+    def append (self, value):
+        index = self.count
+        self.count += 1
+        self.tail.append(value)
+        if self.spilling:
+            self.chunk.append(value)
+            if len(self.chunk) == self.chunkSize:
+                self.flush()
+        if self.mode == "full":
+            self.values.append(value)
+        elif self.mode == "decimate":
+            if index%self.stride == 0:
+                self.values.append(value)
+                self.indices.append(index)
+                if len(self.values) == self.capacity:
+                    self.values = self.values[::2]
+                    self.indices = self.indices[::2]
+                    self.stride *= 2
+        elif self.mode == "buckets":
+            self.addToBucket(index,value)
+        else:
+            if index < self.capacity:
+                self.values.append(value)
+                self.indices.append(index)
+            else:
+                slot = int(self.randomStream.random()*(index+1))
+                if slot < self.capacity:
+                    self.values[slot] = value
+                    self.indices[slot] = index
+
+    def addToBucket (self, index, value):
+        if self.currentBucket is None:
+            self.currentBucket = [index,value,value,0.,0]
+        bucket = self.currentBucket
+        bucket[1] = min(bucket[1],value)
+        bucket[2] = max(bucket[2],value)
+        bucket[3] += value
+        bucket[4] += 1
+        if bucket[4] < self.bucketSize:
+            return
+        self.bucketStarts.append(bucket[0])
+        self.bucketMins.append(bucket[1])
+        self.bucketMaxs.append(bucket[2])
+        self.bucketSums.append(bucket[3])
+        self.bucketCounts.append(bucket[4])
+        self.currentBucket = None
+        if len(self.bucketStarts) == self.capacity:
+            # Merges neighbouring buckets (capacity is even)
+            self.bucketStarts = self.bucketStarts[::2]
+            self.bucketMins = [min(pair) for pair in zip(self.bucketMins[::2],self.bucketMins[1::2])]
+            self.bucketMaxs = [max(pair) for pair in zip(self.bucketMaxs[::2],self.bucketMaxs[1::2])]
+            self.bucketSums = [a+b for (a,b) in zip(self.bucketSums[::2],self.bucketSums[1::2])]
+            self.bucketCounts = [a+b for (a,b) in zip(self.bucketCounts[::2],self.bucketCounts[1::2])]
+            self.bucketSize *= 2
+
+    # Opens the spill file, created (or truncated) if nothing was spilled yet, for appending otherwise
+    def openSpillFile (self):
+        if self.spillPath is None:
+            (descriptor,self.spillPath) = tempfile.mkstemp(suffix=".f64", prefix=self.spillName+"-", dir=self.spillDirectory)
+            return os.fdopen(descriptor,"wb")
+        return open(self.spillPath,"ab" if self.nbSpilled else "wb")
+
+    # Writes the values not yet spilled to the spill file, reopened if closed
+    def flush (self):
+        if not self.spilling or not self.chunk:
+            return
+        if self.spillFile is None:
+            self.spillFile = self.openSpillFile()
+        np.array(self.chunk, dtype=np.float64).tofile(self.spillFile)
+        self.spillFile.flush()
+        self.nbSpilled += len(self.chunk)
+        self.chunk = []
+
+    def close (self):
+        self.flush()
+        if self.spillFile is not None:
+            self.spillFile.close()
+            self.spillFile = None
+
+    def __len__ (self):
+        return self.count
+
+    # The last values (at most tailSize), oldest first
+    def getTail (self):
+        return list(self.tail)
+
+    # Returns the buckets as arrays (starts,mins,maxs,means), the last one possibly not full; only in
+    # buckets mode
+    def getBuckets (self):
+        starts = list(self.bucketStarts)
+        mins = list(self.bucketMins)
+        maxs = list(self.bucketMaxs)
+        sums = list(self.bucketSums)
+        counts = list(self.bucketCounts)
+        if self.currentBucket is not None:
+            starts.append(self.currentBucket[0])
+            mins.append(self.currentBucket[1])
+            maxs.append(self.currentBucket[2])
+            sums.append(self.currentBucket[3])
+            counts.append(self.currentBucket[4])
+        return np.array(starts), np.array(mins), np.array(maxs), np.array(sums)/np.maximum(counts,1)
+
+    # Returns the recorded values as arrays (indices,values) sorted by index, for plotting; in buckets
+    # mode, a value is the mean of a bucket and its index the middle of the bucket
+    def getSeries (self):
+        if self.mode == "full":
+            return np.arange(len(self.values)), np.array(self.values)
+        if self.mode == "buckets":
+            (starts,mins,maxs,means) = self.getBuckets()
+            counts = list(self.bucketCounts)
+            if self.currentBucket is not None:
+                counts.append(self.currentBucket[4])
+            return starts+(np.array(counts)-1)/2., means
+        indices = np.array(self.indices)
+        values = np.array(self.values)
+        order = np.argsort(indices, kind="mergesort")
+        return indices[order], values[order]
+
+    # Checkpoints (see checkpoint): the spill file is not pickled but reopened on load, truncated to
+    # the values spilled at the time of the checkpoint
+    def __getstate__ (self):
+        self.flush()
+        state = self.__dict__.copy()
+        state["spillFile"] = None
+        return state
+
+    def __setstate__ (self, state):
+        self.__dict__.update(state)
+        if self.spillPath is not None:
+            spillFile = open(self.spillPath,"ab")
+            spillFile.truncate(self.nbSpilled*8)
+            spillFile.seek(0,os.SEEK_END)
+            self.spillFile = spillFile
+
+
+# Returns all values spilled to path by a MetricRecorder
+def readSpill (path):
+    return np.fromfile(path, dtype=np.float64)
+
+# Returns a recorder for the metric of given name; values are spilled to a new file of spillDirectory
+# if not None, named name-XXXXXX.f64 with a unique suffix (given by the spillPath of the recorder once
+# the first chunk is written), so that recorders and runs never share a file. The seed of the
+# reservoir mode is derived from seed and name (see rng).
+def makeMetricRecorder (name, mode="full", capacity=10000, spillDirectory=None, seed=None):
+    if seed is not None:
+        seed = deriveSeed(seed,name)
+    return MetricRecorder(mode, capacity, seed=seed, spillDirectory=spillDirectory, spillName=name)
@@ -16,6 +16,12 @@ import numpy as np
 # There are 15 questions, two guarentee points (questions 5 and 10) and three lifelines
 # There are 16 wealth levels according to the numbers of questions correctly answered.
 # A state is final if the game is lost, if the player decided to stop playing or if all questions have been answered successfully
+#jokerFactors[t][i] is the multiplicative coefficient that reduces the failure probability if lifeline i is used at question t
+jokerFactors = np.array([0,0,0, 0.672,0.527,0.745, 0.698,0.547,0.773, 0.707,0.554,0.783, 0.711,0.557,0.788, 0.714,0.559,0.791, 0.716,0.561,0.793,0.717,0.562,0.795,0.718,0.563,0.796,0.719,0.563,0.796,0.719,0.564,0.797,0.720,0.564,0.798,0.720,0.564,0.798,0.721,0.565,0.799,0.721,0.565,0.799]) 
+jokerFactors = jokerFactors.reshape(15,3)
+#failure[t] is the probability of failing question t without lifelines
+failure = [(0.004+0.051*t) for t in xrange(15)]
+
 class MillionMDP (MDP):
 
     #Conventions for states
@@ -61,11 +67,6 @@ class MillionMDP (MDP):
         return self.wealthLevels[int(finalState[4:])]
 
     def transitionFunction (self, state, action):
-	jokerFactors = np.array([0,0,0, 0.672,0.527,0.745, 0.698,0.547,0.773, 0.707,0.554,0.783, 0.711,0.557,0.788, 0.714,0.559,0.791, 0.716,0.561,0.793,0.717,0.562,0.795,0.718,0.563,0.796,0.719,0.563,0.796,0.719,0.564,0.797,0.720,0.564,0.798,0.720,0.564,0.798,0.721,0.565,0.799,0.721,0.565,0.799]) 
-	jokerFactors = jokerFactors.reshape(15,3)
-	#jokerFactors[t][i] is the multiplicative coefficient that reduces the failure probability if lifeline i is used at question t
-	failure = [(0.004+0.051*t) for t in xrange(15)]
-	
 	if action == "reinit":
 	   return {"play_111_0":1.}
 	
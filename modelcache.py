@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import hashlib
+import inspect
+import marshal
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# ===============================================================================================
+# An on-disk cache of compiled MDPs (see MDP.compile). Each model is stored in its own directory of
+# the cache, named after its type and a hash of its parameters (see MDP.getModelParameters, which
+# include a digest of the code of the model) and of the format version, with one .npy file per array, so that later runs memory-map the arrays
+# instead of rebuilding them. (Members of .npz archives cannot be memory-mapped, hence .npy files.)
+# ===============================================================================================
+
+# To be increased whenever the compiled form or the layout of the cache changes
+FORMAT_VERSION = 1
+
+# Arrays of the compiled form which are cached, together with the lists of the model
+compiledArrays = ["allowedMask","finalMask","wealthIds","rowOffsets","nextStateIds","probabilities"]
+
+# Digest of the code defining the model of mdp: the sources of the modules of its class and of the
+# classes it derives from (which hold the transition functions and the constants they use), or, when
+# a source is not available, the compiled code of the transition function
+def getSourceDigest (mdp):
+    digest = hashlib.sha1()
+    for modelClass in inspect.getmro(mdp.__class__):
+        try:
+            digest.update(inspect.getsource(inspect.getmodule(modelClass)))
+        except (IOError, TypeError):
+            digest.update(marshal.dumps(mdp.transitionFunction.func_code))
+    return digest.hexdigest()
+
+def getModelKey (mdp):
+    parameters = sorted(mdp.getModelParameters().items())
+    return mdp.mdpType+"-"+hashlib.sha1(repr((FORMAT_VERSION,parameters))).hexdigest()[:16]
+
+def getModelDirectory (mdp, cacheDirectory):
+    return os.path.join(cacheDirectory,getModelKey(mdp))
+
+# Writes the compiled form of mdp to the cache; the directory of the model is written under a
+# temporary name then renamed, so that concurrent runs never read a partially written model
+def saveCompiledModel (mdp, cacheDirectory):
+    directory = getModelDirectory(mdp,cacheDirectory)
+    if os.path.isdir(directory):
+        return
+    if not os.path.isdir(cacheDirectory):
+        os.makedirs(cacheDirectory)
+    temporaryDirectory = tempfile.mkdtemp(dir=cacheDirectory)
+    np.save(os.path.join(temporaryDirectory,"version.npy"), np.array([FORMAT_VERSION]))
+    np.save(os.path.join(temporaryDirectory,"states.npy"), np.array(mdp.states))
+    np.save(os.path.join(temporaryDirectory,"actions.npy"), np.array(mdp.actions))
+    np.save(os.path.join(temporaryDirectory,"wealthLevels.npy"), np.array(mdp.wealthLevels, dtype=str))
+    np.save(os.path.join(temporaryDirectory,"finalStates.npy"), np.array(mdp.finalStates))
+    for name in compiledArrays:
+        np.save(os.path.join(temporaryDirectory,name+".npy"), getattr(mdp,name))
+    try:
+        os.rename(temporaryDirectory,directory)
+    except OSError:
+        # Another run has written the same model in the meantime
+        shutil.rmtree(temporaryDirectory)
+
+# Reads the compiled form of mdp from the cache into mdp (whose index must be built), with arrays
+# memory-mapped read-only; returns False if the cache does not hold a model with the same states,
+# actions, wealth levels and final states
+def loadCompiledModel (mdp, cacheDirectory):
+    directory = getModelDirectory(mdp,cacheDirectory)
+    if not os.path.isdir(directory):
+        return False
+    def load (name, mmapMode=None):
+        return np.load(os.path.join(directory,name+".npy"), mmap_mode=mmapMode)
+    if load("version")[0] != FORMAT_VERSION:
+        return False
+    for name in ["states","actions","wealthLevels","finalStates"]:
+        if load(name).tolist() != list(getattr(mdp,name)):
+            return False
+    for name in compiledArrays:
+        setattr(mdp,name,load(name,"r"))
+    return True
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import collections
+import copy
+import threading
+
+from instrumentation import *
+
+# ===============================================================================================
+# The observation of a learner during a simulation (observation functions, best response value and
+# score), either run synchronously by the simulation (observe) or off the learning thread by an
+# AsyncObserver. The latter is given snapshots of the learner (see snapshotAgent), which a background
+# thread observes in order; at most queueSize snapshots wait, and when the queue is full the
+# overflow policy decides:
+#
+# - "block": the simulation waits for room (no observation is lost)
+# - "drop": the new snapshot is discarded
+# - "merge": the new snapshot replaces the newest waiting one (the latest state is observed)
+#
+# The steps actually observed are listed in observedSteps, and the number of lost snapshots is
+# nbDropped.
+# ===============================================================================================
+
+# Attributes of the learners which change while learning, and are copied in snapshots; the random
+# stream is copied so that observation code drawing from it (such as getBestAction) neither changes
+# the draws of the learner nor shares its buffer with the background thread
+snapshotAttributes = ["QValues", "nbExperiences", "nbVisits", "wealth_frequencies", "real_wealth_frequencies", "policy", "maxIndex", "randomStream"]
+
+# Runs the observation functions, then (if recordScore) appends the best response value (for MDPs
+# with wealth levels) and the score (max Q value of the initial state of agent) to the lists of agent
+def observe (mdp, agent, initialState, i, observationFunctions, instrumentation, recordScore=True):
+    for observationFunction in observationFunctions:
+        observationFunction(mdp,agent,initialState,i)
+    if not recordScore:
+        return
+    reward_dict = {}
+    if not mdp.mdpType == "DataCenter" and not mdp.mdpType == "Garnets":
+        for final_state in mdp.finalStates:
+            reward_dict[final_state] = agent.getCurrentRewardWealthLevel(mdp.wealthFunction(final_state))
+        brv =  mdp.solveMDP(reward_dict)
+        if instrumentation.informing:
+            instrumentation.info("best response value ",brv)
+        agent.bestResponseValue.append(brv)
+    state = agent.initialState
+    sum_p = agent.getMaxQValue(state)
+    agent.score.append(sum_p)
+    sump = 1
+    for w in agent.mdp.getWealthLevels():
+        sump-= agent.real_wealth_frequencies[w]
+        if(sump < agent.q):
+            if instrumentation.informing:
+                instrumentation.info('q ',w)
+            break
+    if instrumentation.informing:
+        instrumentation.info(agent.getExpectedReward())
+        instrumentation.info(agent.theta)
+
+# Returns a copy of agent sharing its MDP and its lists of results (score, bestResponseValue...),
+# so that observing the copy records results in agent, but with its own copy of the tables which
+# change while learning. The copy is cheap for dense learners (copies of arrays).
+def snapshotAgent (agent):
+    snapshot = copy.copy(agent)
+    memo = {id(agent.mdp):agent.mdp}
+    for attribute in snapshotAttributes:
+        if hasattr(agent,attribute):
+            setattr(snapshot,attribute,copy.deepcopy(getattr(agent,attribute),memo))
+    return snapshot
+
+
+class AsyncObserver ():
+
+    def __init__ (self, observationFunctions, queueSize=4, overflow="block", instrumentation=None):
+        if not overflow in ["block","drop","merge"]:
+            raise ValueError("Unknown overflow policy "+str(overflow))
+        if instrumentation is None:
+            instrumentation = defaultInstrumentation
+        self.observationFunctions = observationFunctions
+        self.queueSize = queueSize
+        self.overflow = overflow
+        self.instrumentation = instrumentation
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closing = False
+        self.error = None
+        self.observedSteps = []
+        self.nbDropped = 0
+
+    # Starts the background thread if not running; the MDP is compiled here, in the calling thread,
+    # so that the observer only reads it
+    def start (self, mdp):
+        if self.thread is not None:
+            return
+        mdp.compile()
+        self.closing = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Queues the observation of a snapshot of agent at step i
+    def submit (self, mdp, agent, initialState, i, recordScore=True):
+        if self.error is not None:
+            self.finish()
+        self.start(mdp)
+        task = (mdp,snapshotAgent(agent),initialState,i,recordScore)
+        self.condition.acquire()
+        try:
+            if len(self.pending) >= self.queueSize:
+                if self.overflow == "drop":
+                    self.nbDropped += 1
+                    return
+                if self.overflow == "merge":
+                    self.pending.pop()
+                    self.nbDropped += 1
+                else:
+                    while len(self.pending) >= self.queueSize and self.error is None:
+                        self.condition.wait()
+            self.pending.append(task)
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def run (self):
+        while True:
+            self.condition.acquire()
+            try:
+                while not self.pending and not self.closing:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                (mdp,agent,initialState,i,recordScore) = self.pending.popleft()
+                self.condition.notifyAll()
+            finally:
+                self.condition.release()
+            try:
+                observe(mdp,agent,initialState,i,self.observationFunctions,self.instrumentation,recordScore)
+                self.observedSteps.append(i)
+            except Exception, error:
+                self.condition.acquire()
+                self.error = error
+                self.pending.clear()
+                self.condition.notifyAll()
+                self.condition.release()
+                return
+
+    # Waits until all queued snapshots are observed and stops the background thread; errors raised
+    # by observations are raised again here
+    def finish (self):
+        if self.thread is None:
+            return
+        self.condition.acquire()
+        self.closing = True
+        self.condition.notifyAll()
+        self.condition.release()
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import heapq
+
+import numpy as np
+
+# ===============================================================================================
+# Planning with the known model of an MDP (prioritized sweeping, Moore and Atkeson 1993), for dense
+# learners (see tables). After every real transition of the learner, a PrioritizedSweeping planner
+# performs up to budget full backups
+#
+#   Q(s,a) <- sum_s' P(s'|s,a) (r(s') + max_a' Q(s',a'))
+#
+# over the compiled transitions of the MDP, in decreasing order of Bellman error |backup - Q(s,a)|.
+# The pair of the real transition is queued first; after the backup of a pair (s,a), the predecessors
+# of s (pairs with a transition to s) are queued with their own errors. Errors at most threshold
+# are not queued. Only pairs from which the learner itself learns are backed up (non-final states,
+# allowed actions).
+#
+# The reward r(s') of a next state is given by the learner (getReplayRewards, with the current
+# theta of a QQ-learner); this requires rewards which only depend on next states, which is not the
+# case for DataCenter (the reward of an episode depends on its cumulated cost). Only final states
+# have rewards.
+#
+# The targets r(s') + max_a' Q(s',a') of all states are kept between steps: at every step, only the
+# rewards of final states and the targets of the states whose Q values changed since the last step
+# (as collected by the MaxQIndex of the learner) are refreshed, so that a step costs time
+# proportional to the budget and to these changes, not to the size of the model.
+# ===============================================================================================
+
+class PrioritizedSweeping ():
+
+    def __init__ (self, mdp, budget=10, threshold=1e-6):
+        if mdp.mdpType == "DataCenter":
+            raise ValueError("Planning needs rewards which only depend on states, which is not the case for DataCenter")
+        mdp.compile()
+        self.mdp = mdp
+        self.budget = budget
+        self.threshold = threshold
+        self.nbStates = len(mdp.states)
+        self.nbActions = len(mdp.actions)
+        # Pairs, as rows of the compiled arrays, from which the learner learns
+        plannable = mdp.allowedMask & ~mdp.finalMask[:,np.newaxis]
+        self.plannable = plannable.reshape(-1)
+        # Predecessors of every state, as rows of plannable pairs, indexed by predecessorOffsets
+        entryRowIds = mdp.getEntryRowIds()
+        kept = self.plannable[entryRowIds]
+        nextStateIds = mdp.nextStateIds[kept]
+        order = np.argsort(nextStateIds, kind="mergesort")
+        self.predecessorRows = entryRowIds[kept][order]
+        self.predecessorOffsets = np.searchsorted(nextStateIds[order], np.arange(self.nbStates+1))
+        # For the predecessors of every state: the entries of their rows in the compiled arrays, and the
+        # position of the predecessor of each entry
+        self.predecessorEntries = []
+        self.predecessorPositions = []
+        for stateId in xrange(self.nbStates):
+            rows = self.predecessorRows[self.predecessorOffsets[stateId]:self.predecessorOffsets[stateId+1]]
+            starts = mdp.rowOffsets[rows]
+            lengths = mdp.rowOffsets[rows+1]-starts
+            self.predecessorEntries.append(np.repeat(starts-np.cumsum(lengths)+lengths, lengths)+np.arange(lengths.sum()))
+            self.predecessorPositions.append(np.repeat(np.arange(len(rows)), lengths))
+        # Priority queue of rows (with stale entries), and current priority of every queued row
+        self.queue = []
+        self.priorities = {}
+        self.nbBackups = 0
+        # Ids of final states; rewards of all states, and targets, for learner (built by its first plan)
+        self.finalIds = np.flatnonzero(mdp.finalMask)
+        self.learner = None
+        self.rewards = None
+        self.targets = None
+
+    # Returns the backup of row, given the reward plus max Q value of every state
+    def getBackup (self, row, targets):
+        mdp = self.mdp
+        start = mdp.rowOffsets[row]
+        end = mdp.rowOffsets[row+1]
+        return np.dot(mdp.probabilities[start:end],targets[mdp.nextStateIds[start:end]])
+
+    # Returns the backups of the predecessors of a state, given the reward plus max Q value of every state
+    def getPredecessorBackups (self, stateId, targets):
+        entries = self.predecessorEntries[stateId]
+        contributions = self.mdp.probabilities[entries]*targets[self.mdp.nextStateIds[entries]]
+        return np.bincount(self.predecessorPositions[stateId], weights=contributions, minlength=self.predecessorOffsets[stateId+1]-self.predecessorOffsets[stateId])
+
+    # Queues rows with given priorities, above the threshold and above their current priority
+    def push (self, rows, priorities):
+        above = priorities > self.threshold
+        for (row,priority) in zip(rows[above].tolist(),priorities[above].tolist()):
+            if priority > self.priorities.get(row,0.):
+                self.priorities[row] = priority
+                heapq.heappush(self.queue,(-priority,row))
+
+    # Returns the row of highest priority, or None if the queue is empty
+    def pop (self):
+        while self.queue:
+            (priority,row) = heapq.heappop(self.queue)
+            if self.priorities.get(row) == -priority:
+                del self.priorities[row]
+                return row
+        return None
+
+    # Returns the rewards of final states for learner
+    def getFinalRewards (self, learner):
+        nbFinal = len(self.finalIds)
+        return learner.getReplayRewards(np.zeros(nbFinal, dtype=np.bool_), self.mdp.wealthIds[self.finalIds], np.zeros(nbFinal))
+
+    # Brings the targets up to date with the Q values and rewards of learner; they are computed for all
+    # states the first time, and the learner then collects the states whose Q values change
+    def refreshTargets (self, learner):
+        mdp = self.mdp
+        if learner is not self.learner:
+            self.learner = learner
+            learner.maxIndex.trackChanges()
+            learner.maxIndex.popChangedStates()
+            self.rewards = np.zeros(self.nbStates)
+            self.rewards[self.finalIds] = self.getFinalRewards(learner)
+            self.targets = self.rewards+np.where(mdp.allowedMask, learner.QValues.values, -np.inf).max(axis=1)
+            return
+        finalRewards = self.getFinalRewards(learner)
+        changed = finalRewards != self.rewards[self.finalIds]
+        if changed.any():
+            changedIds = self.finalIds[changed]
+            self.targets[changedIds] += finalRewards[changed]-self.rewards[changedIds]
+            self.rewards[changedIds] = finalRewards[changed]
+        for state in learner.maxIndex.popChangedStates():
+            stateId = mdp.stateIndex[state]
+            self.targets[stateId] = self.rewards[stateId]+learner.getMaxQValue(state)
+
+    # Plans after the real transition of learner from state with action
+    def plan (self, learner, state, action):
+        mdp = self.mdp
+        flatValues = learner.QValues.values.reshape(-1)
+        # Reward plus max Q value of every state, kept up to date along backups
+        self.refreshTargets(learner)
+        targets = self.targets
+        row = mdp.getRowId(mdp.stateIndex[state],mdp.actionIndex[action])
+        if self.plannable[row]:
+            self.push(np.array([row]),np.array([abs(self.getBackup(row,targets)-flatValues[row])]))
+        for i in xrange(self.budget):
+            row = self.pop()
+            if row is None:
+                break
+            (stateId,actionId) = divmod(row,self.nbActions)
+            state = mdp.states[stateId]
+            learner.setQValue(state,mdp.actions[actionId],self.getBackup(row,targets))
+            targets[stateId] = self.rewards[stateId]+learner.getMaxQValue(state)
+            self.nbBackups += 1
+            predecessors = self.predecessorRows[self.predecessorOffsets[stateId]:self.predecessorOffsets[stateId+1]]
+            if len(predecessors):
+                self.push(predecessors,np.abs(self.getPredecessorBackups(stateId,targets)-flatValues[predecessors]))
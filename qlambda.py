@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+from qlearning import *
+from qqlearning import *
+
+# ===============================================================================================
+# Q(lambda) variants of the learners (Watkins' version). Every update of a Q value with TD error
+# delta also moves all pairs (state,action) with an eligibility trace e > 0 by alpha*delta*e, with
+# their own step sizes; the trace of the updated pair is set to 1 and all traces then decay by
+# traceDecay (lambda). Traces are kept in a dictionary of the active pairs only, pairs whose trace
+# falls below traceThreshold being dropped, so that an update costs time proportional to the number
+# of recently visited pairs. Traces are cut at the end of episodes and when a non greedy action is
+# chosen.
+# ===============================================================================================
+
+class EligibilityTraces ():
+
+    def initTraces (self, traceDecay, traceThreshold):
+        self.traceDecay = traceDecay
+        self.traceThreshold = traceThreshold
+        self.traces = {}
+
+    def updateQValue (self, state, action, target):
+        delta = target-self.getQValue(state,action)
+        traces = self.traces
+        traces[(state,action)] = 1.
+        activeTraces = {}
+        for ((s,a),trace) in traces.iteritems():
+            value = self.getQValue(s,a)
+            self.setQValue(s,a,value+self.getAlpha(self.getNbExperiences(s,a))*delta*trace)
+            trace *= self.traceDecay
+            if trace >= self.traceThreshold:
+                activeTraces[(s,a)] = trace
+        self.traces = activeTraces
+
+    # Cuts traces if action, chosen in state, ends an episode or is not greedy
+    def cutTraces (self, state, action):
+        if not self.traces:
+            return
+        if action == "reinit" or self.mdp.isFinal(state) or self.getQValue(state,action) < self.getMaxQValue(state):
+            self.traces = {}
+
+
+class QLambdaLearning (EligibilityTraces, QLearning):
+
+    def __init__ (self, mdp, initialState, epsilon, traceDecay=0.9, traceThreshold=1e-3, **options):
+        QLearning.__init__(self,mdp,initialState,epsilon,**options)
+        self.initTraces(traceDecay,traceThreshold)
+
+    def chooseAction (self, state):
+        action = QLearning.chooseAction(self,state)
+        self.cutTraces(state,action)
+        return action
+
+
+class QQLambdaLearning (EligibilityTraces, QQLearning):
+
+    def __init__ (self, mdp, initialState, epsilon, tau, theta, constant, traceDecay=0.9, traceThreshold=1e-3, **options):
+        QQLearning.__init__(self,mdp,initialState,epsilon,tau,theta,constant,**options)
+        self.initTraces(traceDecay,traceThreshold)
+
+    def chooseAction (self, state):
+        action = QQLearning.chooseAction(self,state)
+        self.cutTraces(state,action)
+        return action
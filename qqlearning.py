@@ -7,6 +7,14 @@ import random
 import numpy as np
 
 from vectors import *
+from tables import *
+from instrumentation import *
+from metrics import *
+from analytics import *
+from exploration import *
+from replay import *
+from planning import *
+from rng import *
 
 # ===============================================================================================
 # A class defining a generic "SSB Q learner". Nothing here is specific to Gardner's dice
@@ -29,38 +37,65 @@ class QQLearning ():
 
     # Initial state: from which it tries to maximise reward
     # Epsilon: if random(1)<epsilon, exploration
-    def __init__ (self, mdp, initialState, epsilon, tau, theta, constant):
+    # Dense: whether QValues, nbExperiences and nbVisits are stored as arrays (see tables), with
+    # Q values of type dtype
+    # Metric mode: how thetas and histories are recorded (see metrics), with given capacity, and
+    # spilled to files of spillDirectory if not None
+    # Seed: of the random streams of the learner and of its metric recorders (see rng), drawn from the
+    # global generator if None
+    # Instrumentation: through which the learner logs (defaultInstrumentation if None); simulate gives
+    # the learner its own instrumentation
+    def __init__ (self, mdp, initialState, epsilon, tau, theta, constant, dense=False, dtype=np.float64, metricMode="full", metricCapacity=10000, spillDirectory=None, seed=None, instrumentation=None):
         self.mdp = mdp
+        if instrumentation is None:
+            instrumentation = defaultInstrumentation
+        self.instrumentation = instrumentation
+        self.randomStream = RandomStream(seed,"learner")
         self.initialState = initialState
         self.epsilon = epsilon
-        self.wealth_frequencies = {}
-        self.real_wealth_frequencies = {}
         self.bestResponseValue = []
         self.nbVisits = {}
         self.nbExperiences = {}
         self.QValues = {}
-        self.thetas = []
+        self.thetas = makeMetricRecorder("thetas",metricMode,metricCapacity,spillDirectory,seed)
         self.score  =[]
         self.initTheta = theta
         self.theta = theta
         self.q = 1 - tau
         self.constant = constant
-        self.histories = []
+        self.histories = makeMetricRecorder("histories",metricMode,metricCapacity,spillDirectory,seed)
+        # Streaming estimate of the tau-quantile of the returns of histories
+        self.returnQuantile = P2Quantile(1-self.q)
         
-        for state in self.mdp.getStates():
-            self.nbVisits[state] = 0
-            self.nbExperiences[state] = {}
-            self.QValues[state] = {}
-            for action in self.mdp.getAllowedActions(state):
-                self.nbExperiences[state][action] = 0
-                self.QValues[state][action] = 0
-        for state in self.mdp.getStates():
-            self.QValues[state]["reinit"] = 0
+        self.dense = dense
+        if self.dense:
+            self.mdp.buildIndex()
+            qMask = self.mdp.allowedMask.copy()
+            qMask[:,self.mdp.actionIndex["reinit"]] = True
+            self.QValues = DenseTable(self.mdp,qMask,dtype)
+            self.nbExperiences = DenseTable(self.mdp,self.mdp.allowedMask,np.int64)
+            self.nbVisits = DenseCounter(self.mdp)
+        else:
+            for state in self.mdp.getStates():
+                self.nbVisits[state] = 0
+                self.nbExperiences[state] = {}
+                self.QValues[state] = {}
+                for action in self.mdp.getAllowedActions(state):
+                    self.nbExperiences[state][action] = 0
+                    self.QValues[state][action] = 0
+            for state in self.mdp.getStates():
+                self.QValues[state]["reinit"] = 0
             
+        # Maximum Q values and greedy actions, kept up to date by setQValue
+        self.maxIndex = MaxQIndex(self.mdp,self.QValues if self.dense else None)
+
         nb_wealth_levels = sum(1 for i in self.mdp.getWealthLevels())
-        for wealth_level in self.mdp.getWealthLevels():
-            self.wealth_frequencies[wealth_level] = 1/float(nb_wealth_levels)
-            self.real_wealth_frequencies[wealth_level] = 1/float(nb_wealth_levels)
+        self.wealth_frequencies = ScaledDistribution(self.mdp.getWealthLevels(),1/float(max(nb_wealth_levels,1)))
+        self.real_wealth_frequencies = ScaledDistribution(self.mdp.getWealthLevels(),1/float(max(nb_wealth_levels,1)))
+        # Indices of wealth levels, and rewards of all wealth levels for theta rewardVectorTheta
+        self.wealthLevelIndex = dict((wealthLevel,i) for (i,wealthLevel) in enumerate(self.mdp.getWealthLevels()))
+        self.rewardVector = None
+        self.rewardVectorTheta = None
         # Debug information
         self.debug = False
         self.nbEpsilons = 0
@@ -68,9 +103,14 @@ class QQLearning ():
         self.nbExploitations = 0
         self.nbWealthObtained = 0
         self.realNbWealthObtained = 0
-        self.strategy = "epsilon-greedy"  #boltzmann or epsilon-greedy or epsilon-greedy-traj
+        self.strategy = "epsilon-greedy"  #boltzmann, ucb, epsilon-greedy or epsilon-greedy-traj (see exploration)
         self.isRandomTraj = 0
         self.temperature = 5
+        self.ucbCoefficient = 1.
+        # Replay buffer (see replay and setReplay), or None
+        self.replay = None
+        # Planner using the model of the MDP (see planning and setPlanner), or None
+        self.planner = None
 
 
     # If several optimal actions, random choice
@@ -95,11 +135,11 @@ class QQLearning ():
         
         # Exploration (epsilon-greedy)
         if self.strategy == "epsilon-greedy":
-            choice = random.random()
+            choice = self.randomStream.random()
             if choice<self.epsilon:
                 self.nbEpsilons += 1
                 allActions=self.mdp.getAllowedActions(state)[:]
-                res = random.choice(allActions)
+                res = self.randomStream.choice(allActions)
                 if self.debug and not self.mdp.isFinal(state):
                     print res,"(exploring because of epsilon)"
                 return res
@@ -112,7 +152,7 @@ class QQLearning ():
             if self.isRandomTraj == 1:
                 self.nbEpsilons += 1
                 allActions=self.mdp.getAllowedActions(state)[:]
-                res = random.choice(allActions)
+                res = self.randomStream.choice(allActions)
                 if self.debug and not self.mdp.isFinal(state):
                     print res,"(exploring because of epsilon)"
                 return res
@@ -121,27 +161,47 @@ class QQLearning ():
             return self.getBestAction(state)
             if self.debug and not self.mdp.isFinal(state):
                 print res,"(best)"
-        if self.strategy == "boltzmann":
-            distribution = {action : np.exp(self.QValues[state][action]/self.temperature) for action in self.mdp.getAllowedActions(state)}
-            sumQ = sum(distribution[action] for action in self.mdp.getAllowedActions(state))
-            if(sumQ ==0 ):
-                allActions=self.mdp.getAllowedActions(state)[:]
-                res = random.choice(allActions)
-            distribution = {action : distribution[action]/sumQ for action in self.mdp.getAllowedActions(state)}
-            print distribution
-            #raw_input()
-            randomNumber = random.random()
-            mass = 0
-            for nextAction in distribution.keys():
-                probability = distribution[nextAction]
-                mass = mass+probability
-                if randomNumber <= mass:
-                    return nextAction
+        # Other exploration strategies (see exploration)
+        if self.strategy in explorationStrategies:
+            return explorationStrategies[self.strategy](self,state,allActions)
+
+    # Replays mini-batches of transitions from buffer (a ReplayBuffer) after every real transition;
+    # only for dense learners
+    def setReplay (self, buffer):
+        if not self.dense:
+            raise ValueError("Experience replay needs a dense learner")
+        self.replay = buffer
+
+    # Plans with planner (such as a PrioritizedSweeping) after every real transition; only for dense
+    # learners
+    def setPlanner (self, planner):
+        if not self.dense:
+            raise ValueError("Planning needs a dense learner")
+        self.planner = planner
+
+    # Rewards of replayed transitions (see replay), given as arrays
+    def getReplayRewards (self, terminal, wealthIds, episodeCosts):
+        if self.mdp.mdpType == "DataCenter":
+            return np.where(terminal, np.clip(2000-episodeCosts-self.theta+1, 0, 1), 0.)
+        return np.where(wealthIds >= 0, self.getRewardVector()[wealthIds], 0.)
+
+    # Records the return of a history which has just ended; wealth levels which are not numbers are
+    # recorded by their rank in the wealth levels of the MDP
+    def recordHistory (self, value):
+        if isinstance(value,basestring):
+            value = self.wealthLevelIndex[value]
+        self.histories.append(value)
+        self.returnQuantile.add(value)
+
+    # Writes the recorded metrics which are not yet in their spill files, and closes these
+    def close (self):
+        self.thetas.close()
+        self.histories.close()
 
     # Informs the algorithm of an experienced transition
     def inform (self, state, action, nextState):
         if self.strategy == "epsilon-greedy-traj" and nextState == self.initialState:
-            choice = random.random()
+            choice = self.randomStream.random()
             if choice<self.epsilon:
                 self.isRandomTraj =1
             else:
@@ -154,7 +214,7 @@ class QQLearning ():
         reward = 0
         if self.mdp.isFinal(nextState):
             wealthLevel = self.mdp.wealthFunction(nextState)
-            self.histories.append(wealthLevel)
+            self.recordHistory(wealthLevel)
             reward = self.getCurrentRewardWealthLevel(wealthLevel)
             if self.isRandomTraj==0:
                 self.nbWealthObtained += 1
@@ -162,10 +222,7 @@ class QQLearning ():
 
         #self.rewards_obtained.append(reward)
 
-        max_Q_next_state = None
-        for nextAction in self.mdp.getAllowedActions(nextState):
-            if self.QValues[nextState][nextAction] > max_Q_next_state or max_Q_next_state == None:
-                max_Q_next_state = self.QValues[nextState][nextAction]
+        max_Q_next_state = self.getMaxQValue(nextState)
 
         if self.mdp.isFinal(nextState):
             if self.strategy == "epsilon-greedy-traj" and self.isRandomTraj ==0:
@@ -180,24 +237,15 @@ class QQLearning ():
         self.addVisit(state)
         self.addExperience(state,action)
         if self.mdp.mdpType == "DataCenter" and action != "reinit":
-            activeServer = int(state[1:3])
-            activeServerNext = int(nextState[1:3])
-            arrivalNum = int(state[-2:])
-            arrivalNumNext = int(nextState[-2:])
-            self.mdp.cumulatedCost += activeServer*1 + 1*abs(activeServer-activeServerNext)
-            if arrivalNum < activeServer:
-                self.mdp.cumulatedCost += 1 * arrivalNum**2 / float(activeServer)
-            else:
-                self.mdp.cumulatedCost += 1 * arrivalNum * (activeServer + 10*(arrivalNum-activeServer)) / float(activeServer)
+            self.mdp.cumulatedCost += self.mdp.getStepCost(state,nextState)
             if self.mdp.counter == self.mdp.horizon:
                 max_Q_next_state = 0
-                if arrivalNumNext < activeServerNext:
-                    self.mdp.cumulatedCost += 1 * arrivalNumNext**2 / float(activeServerNext)
-                else:
-                    self.mdp.cumulatedCost += 1 * arrivalNumNext * float(activeServerNext + 10*(arrivalNumNext-activeServerNext)) / activeServerNext
+                self.mdp.cumulatedCost += self.mdp.getTerminalCost(nextState)
                 reward = self.getCumulatedCostLevel(self.mdp.cumulatedCost)
-                self.histories.append(2000-self.mdp.cumulatedCost)
-            self.QValues[state][action] = self.QValues[state][action] + self.getAlpha(self.nbExperiences[state][action])*(reward + max_Q_next_state - self.QValues[state][action])
+                self.recordHistory(2000-self.mdp.cumulatedCost)
+            self.updateQValue(state,action,reward + max_Q_next_state)
+            if self.replay is not None:
+                self.replay.record(state,action,nextState,self.mdp.counter == self.mdp.horizon,self.mdp.cumulatedCost)
             if self.mdp.counter == self.mdp.horizon:
                 if self.isRandomTraj==0:
                     self.nbWealthObtained += 1
@@ -206,7 +254,13 @@ class QQLearning ():
             #print "update cumulatedCost", self.mdp.cumulatedCost
         else: 
             if not self.mdp.isFinal(state):
-                self.QValues[state][action] = self.QValues[state][action] + self.getAlpha(self.nbExperiences[state][action])*(reward + max_Q_next_state - self.QValues[state][action])
+                self.updateQValue(state,action,reward + max_Q_next_state)
+                if self.replay is not None:
+                    self.replay.record(state,action,nextState,False)
+                if self.planner is not None:
+                    self.planner.plan(self,state,action)
+        if self.replay is not None:
+            self.replay.replay(self)
         
         # Debug
         if self.debug and not self.mdp.isFinal(state):
@@ -219,28 +273,53 @@ class QQLearning ():
     # by information, which is supposed to be indexed by [state][action]
     # Random choice between actions with best value
     def getBestAction (self, state):
-        # Maximisation
-        bestValue = None
-        bestActions = []
-        for action in self.mdp.getAllowedActions(state):
-            expectedReward = self.QValues[state][action]
-            if bestValue==None or expectedReward>bestValue:
-                bestValue = expectedReward
-                bestActions = [action]
-            elif expectedReward==bestValue:
-                bestActions += [action]
-        return random.choice(bestActions)
+        return self.randomStream.choice(self.maxIndex.getArgMax(state,self.getQValue))
+
+    # Maximum Q value over the actions allowed in state
+    def getMaxQValue (self, state):
+        return self.maxIndex.getMax(state,self.getQValue)
+
+    def getQValue (self, state, action):
+        if self.dense:
+            return self.QValues.getValue(state,action)
+        return self.QValues[state][action]
+
+    def setQValue (self, state, action, value):
+        if self.dense:
+            self.QValues.setValue(state,action,value)
+            value = self.QValues.getValue(state,action)
+        else:
+            self.QValues[state][action] = value
+        self.maxIndex.update(state,action,value,self.getQValue)
+
+    # Moves the Q value of (state,action) towards target, with the step size of its last experience
+    def updateQValue (self, state, action, target):
+        value = self.getQValue(state,action)
+        self.setQValue(state,action,value+self.getAlpha(self.getNbExperiences(state,action))*(target-value))
 
     
     def getCurrentRewardWealthLevel (self, wealthLevel):
-        i = self.mdp.getWealthLevels().index(wealthLevel)
+        i = self.wealthLevelIndex[wealthLevel]
         reward = max(min(1,i-self.theta+1),0)
         return reward
 
+    # Rewards of all wealth levels for the current theta, as an array in the order of the wealth
+    # levels; rebuilt only when theta has changed
+    def getRewardVector (self):
+        if self.rewardVectorTheta != self.theta:
+            self.rewardVector = np.clip(np.arange(len(self.wealthLevelIndex))-self.theta+1, 0, 1)
+            self.rewardVectorTheta = self.theta
+        return self.rewardVector
+
+    # Expected reward of the wealth levels actually obtained, for the current theta
+    def getExpectedReward (self):
+        return np.dot(self.real_wealth_frequencies.values(),self.getRewardVector()).item()
+
     def getCumulatedCostLevel(self, cumulatedCost):
         #cumulatedCost = 20 - cumulatedCost/100.
         cumulatedCost = 2000 - cumulatedCost
-        print "cumulatedCost", cumulatedCost
+        if self.instrumentation.debugging:
+            self.instrumentation.debug("cumulatedCost",cumulatedCost)
         reward = max(min(1,cumulatedCost-self.theta+1),0)
         return reward
 
@@ -258,31 +337,45 @@ class QQLearning ():
 
     # Handling of visits and experiences ===============================================
     def addVisit (self, state):
-        if not state in self.nbVisits.keys():
+        if self.dense:
+            self.nbVisits.addValue(state,1)
+            return
+        if not state in self.nbVisits:
             self.nbVisits[state] = 0
         self.nbVisits[state] += 1
 
     def getNbVisits (self, state):
-        if not state in self.nbVisits.keys():
+        if not state in self.nbVisits:
             return 0
         return self.nbVisits[state]
 
     def addExperience (self, state, action):
-        if not state in self.nbExperiences.keys():
+        if self.dense:
+            self.nbExperiences.addValue(state,action,1)
+            return
+        if not state in self.nbExperiences:
             self.nbExperiences[state] = {}
-        if not action in self.nbExperiences[state].keys():
+        if not action in self.nbExperiences[state]:
             self.nbExperiences[state][action] = 0
         self.nbExperiences[state][action] += 1
 
     def getNbExperiences (self, state, action):
-        if not state in self.nbExperiences.keys() or not action in self.nbExperiences[state]:
+        if self.dense:
+            return self.nbExperiences.getValue(state,action)
+        if not state in self.nbExperiences or not action in self.nbExperiences[state]:
             return 0
         return self.nbExperiences[state][action]
 
+    # Frequency with which action has been played in state so far (policy actually played)
+    def getPolicy (self, state, action):
+        nbVisits = self.getNbVisits(state)
+        if nbVisits == 0:
+            return 0.
+        return self.getNbExperiences(state,action)/float(nbVisits)
+
     def update_theta(self,nbExperiences):
         state = self.initialState
-        sum_p = max(self.QValues[state][action] for action in self.mdp.getAllowedActions(state))
-        sum_p2 = sum( self.real_wealth_frequencies[wealthLevel]*self.getCurrentRewardWealthLevel(wealthLevel) for wealthLevel in self.mdp.getWealthLevels())
+        sum_p = self.getMaxQValue(state)
         #print "sum_p1", sum_p, "q", self.q
         #print self.getGamma(nbExperiences)*((sum_p - self.q))
         if sum_p != 0:
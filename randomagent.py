@@ -3,7 +3,7 @@
 @author: Hugo Gilbert and Bruno Zanuttini
 """
 
-import random
+from rng import *
 
 # ===============================================================================================
 # A class for an agent which always chooses the action at random in an MDP (among those allowed).
@@ -12,14 +12,19 @@ import random
 
 class RandomAgent ():
 
-    def __init__ (self, mdp):
+    # Seed: of the random stream of the agent (see rng), drawn from the global generator if None
+    def __init__ (self, mdp, seed=None):
         self.mdp = mdp
+        self.randomStream = RandomStream(seed,"agent")
 
     def chooseAction (self, state):
-        return random.choice(self.mdp.getAllowedActions(state))
+        return self.randomStream.choice(self.mdp.getAllowedActions(state))
 
     def inform (self, state, action, nextState):
         pass
 
+    def close (self):
+        pass
+
     def __str__ (self):
         return "Random Agent"
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import numpy as np
+
+from rng import *
+
+# ===============================================================================================
+# Experience replay for dense learners (see tables). A ReplayBuffer keeps the last capacity
+# transitions from which a learner has updated a Q value, in preallocated arrays used as a ring:
+# state, action and next state ids, whether the transition ends an episode (no bootstrap), the id of
+# the wealth level of the next state (-1 if not final) and the cumulated cost of the episode (for
+# DataCenter). Rewards are not stored but computed from these when replaying, so that they follow
+# the current theta of a QQ-learner.
+#
+# After every real transition, a learner replays on average replayRatio mini-batches of batchSize
+# transitions drawn uniformly from the buffer, each as one vectorised Q-learning update with the
+# current step sizes of the (state,action) pairs (the numbers of experiences are not changed).
+# ===============================================================================================
+
+class ReplayBuffer ():
+
+    def __init__ (self, mdp, capacity=100000, batchSize=32, replayRatio=1., seed=None):
+        mdp.buildIndex()
+        self.mdp = mdp
+        self.capacity = capacity
+        self.batchSize = batchSize
+        self.replayRatio = replayRatio
+        self.stateIds = np.zeros(capacity, dtype=np.int32)
+        self.actionIds = np.zeros(capacity, dtype=np.int32)
+        self.nextStateIds = np.zeros(capacity, dtype=np.int32)
+        self.terminal = np.zeros(capacity, dtype=np.bool_)
+        self.wealthIds = np.zeros(capacity, dtype=np.int32)
+        self.episodeCosts = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.position = 0
+        # Number of mini-batches owed to the learner
+        self.credit = 0.
+        # Own generator (see rng), so that replaying does not change the random choices of the learner
+        self.random = RandomStream(seed,"replay").generator
+
+    def record (self, state, action, nextState, terminal, episodeCost=0.):
+        position = self.position
+        self.stateIds[position] = self.mdp.stateIndex[state]
+        self.actionIds[position] = self.mdp.actionIndex[action]
+        nextStateId = self.mdp.stateIndex[nextState]
+        self.nextStateIds[position] = nextStateId
+        self.terminal[position] = terminal
+        self.wealthIds[position] = self.mdp.wealthIds[nextStateId]
+        self.episodeCosts[position] = episodeCost
+        self.position = (position+1)%self.capacity
+        self.size = min(self.size+1,self.capacity)
+
+    def __len__ (self):
+        return self.size
+
+    # Returns a mini-batch as arrays (stateIds,actionIds,nextStateIds,terminal,wealthIds,episodeCosts)
+    def sample (self, batchSize):
+        indices = self.random.randint(0,self.size,batchSize)
+        return self.stateIds[indices], self.actionIds[indices], self.nextStateIds[indices], self.terminal[indices], self.wealthIds[indices], self.episodeCosts[indices]
+
+    # Runs the mini-batch updates owed to learner after one real transition
+    def replay (self, learner):
+        if self.size == 0:
+            return
+        self.credit += self.replayRatio
+        while self.credit >= 1.:
+            self.credit -= 1.
+            replayBatch(learner,self.sample(self.batchSize))
+
+
+# One vectorised Q-learning update of a dense learner on a mini-batch; the learner gives the rewards
+# of the transitions through getReplayRewards(terminal,wealthIds,episodeCosts)
+def replayBatch (learner, batch):
+    (stateIds,actionIds,nextStateIds,terminal,wealthIds,episodeCosts) = batch
+    mdp = learner.mdp
+    values = learner.QValues.values
+    nextValues = np.where(mdp.allowedMask[nextStateIds], values[nextStateIds], -np.inf).max(axis=1)
+    targets = learner.getReplayRewards(terminal,wealthIds,episodeCosts)+np.where(terminal, 0., nextValues)
+    alphas = learner.getAlpha(np.maximum(learner.nbExperiences.values[stateIds,actionIds],1).astype(np.float64))
+    currentValues = values[stateIds,actionIds]
+    values[stateIds,actionIds] = currentValues+alphas*(targets-currentValues)
+    learner.maxIndex.invalidateIds(stateIds)
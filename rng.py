@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import hashlib
+import random
+
+import numpy as np
+
+# ===============================================================================================
+# Random streams owned by learners and MDPs, in place of the global generator of the random module.
+# A RandomStream draws uniforms from its own numpy generator by blocks of bufferSize, and serves
+# them one by one as Python floats, so that a step of a simulation costs no call to a generator.
+# Every consumer (learner, MDP, replay buffer...) names its stream, and the generator of a stream is
+# seeded with a hash of its seed and name, so that consumers given the same seed (such as the MDP and
+# the learner of a sweep task) still draw independent numbers, and replicates of a simulation are
+# reproducible whatever the order in which they run. Without a seed, the seed of a stream is drawn
+# from the global generator of the random module, so that seeding it still determines a whole
+# simulation. Vectorised consumers draw arrays directly from the generator of their stream.
+# ===============================================================================================
+
+# Seed of the generator of the stream of given seed and name
+def deriveSeed (seed, name):
+    return int(hashlib.sha1(repr((seed,name))).hexdigest()[:8],16)
+
+class RandomStream ():
+
+    def __init__ (self, seed=None, name="", bufferSize=4096):
+        if seed is None:
+            seed = random.randint(0,2**31-1)
+        self.seed = seed
+        self.name = name
+        self.generator = np.random.RandomState(deriveSeed(seed,name))
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.position = 0
+
+    def refill (self):
+        self.buffer = self.generator.random_sample(self.bufferSize).tolist()
+        self.position = 0
+
+    # Uniform draw in [0,1)
+    def random (self):
+        if self.position == len(self.buffer):
+            self.refill()
+        uniform = self.buffer[self.position]
+        self.position += 1
+        return uniform
+
+    # Element drawn uniformly from a non-empty sequence
+    def choice (self, sequence):
+        return sequence[int(self.random()*len(sequence))]
+
+    # Uniform draw in [low,high)
+    def uniform (self, low, high):
+        return low+(high-low)*self.random()
@@ -3,7 +3,15 @@
 @author: Hugo Gilbert and Bruno Zanuttini
 """
 
+import os
+
 from mdp import *
+from traces import *
+from tracestats import *
+from instrumentation import *
+from observers import *
+from checkpoint import *
+import numpy as np
 
 # ===============================================================================================
 # Various functions for launching simulations, analysing traces and printing statistics.
@@ -15,50 +23,118 @@ from mdp import *
 # Each observationFunction in list observationFunctions: takes mdp, agent, initialState, step and is called after every
 # step-th step and after the last one
 # (can be used, e.g., for printing or for updating global variables)
-# Returns a list of triples (state,action,nextState).
-def simulate (mdp, agent, initialState, numberOfSteps, step, observationFunctions):
-    res = []
+# Transitions (state,action,nextState) are given to trace if not None (see traces for recorders
+# keeping all of them, the last ones only, or compact columns of ids), which is returned. They are
+# also counted in statistics (a TraceStatistics) if not None.
+# Progress is reported through instrumentation (that of the agent, or defaultInstrumentation, if None):
+# observation points at level INFO, every transition at level DEBUG; its counters give the rates of
+# the run. An agent with an instrumentation attribute (such as learners) is given it, so that it logs
+# through the same sinks and level.
+# If observer (an AsyncObserver, see observers) is not None, observations are run on snapshots of
+# the agent by its background thread, with its own observation functions (observationFunctions is
+# then ignored); all of them are done when simulate returns.
+# If checkpointPath is not None, a checkpoint of the run (see checkpoint) is written there every
+# checkpointInterval steps; if resume is true and the file exists, the run is resumed from it: agent,
+# trace and statistics take the state they had then, and the result is the same as without
+# interruption.
+# The agent is closed when simulate returns, so that the metrics it spills to files are complete.
+def simulate (mdp, agent, initialState, numberOfSteps, step, observationFunctions, trace=None, statistics=None, instrumentation=None, observer=None, checkpointPath=None, checkpointInterval=100000, resume=False):
+    if instrumentation is None:
+        instrumentation = getattr(agent,"instrumentation",defaultInstrumentation)
+    debugging = instrumentation.debugging
+    instrumentation.startRun()
+    nbEpisodes = 0
+    initialEpsilons = getattr(agent,"nbEpsilons",0)
     currentState = initialState
     currentAction = None
-    for i in xrange(numberOfSteps):
+    firstStep = 0
+    if resume and checkpointPath is not None and os.path.exists(checkpointPath):
+        checkpoint = loadCheckpoint(checkpointPath,mdp)
+        restoreInto(agent,checkpoint["agent"])
+        if trace is not None and checkpoint["trace"] is not None:
+            restoreInto(trace,checkpoint["trace"])
+        if statistics is not None and checkpoint["statistics"] is not None:
+            restoreInto(statistics,checkpoint["statistics"])
+        (firstStep,currentState,nbEpisodes,initialEpsilons) = checkpoint["simulation"]
+        if instrumentation.informing:
+            instrumentation.info("Resuming from step",firstStep)
+    if hasattr(agent,"instrumentation"):
+        agent.instrumentation = instrumentation
+    for i in xrange(firstStep,numberOfSteps):
+        # Checkpoint (before the observation of the step, which is run again when resuming)
+        if checkpointPath is not None and i%checkpointInterval==0 and i!=firstStep:
+            if observer is not None:
+                observer.finish()
+            saveCheckpoint(checkpointPath,mdp,agent,(i,currentState,nbEpisodes,initialEpsilons),trace,statistics)
         # Run observers
         if i%step==0:
-            print i ,step
-            for observationFunction in observationFunctions:
-                observationFunction(mdp,agent,initialState,i)
-            reward_dict = {}
-            if not mdp.mdpType == "DataCenter" and not mdp.mdpType == "Garnets":
-                for final_state in mdp.finalStates:
-                    reward_dict[final_state] = agent.getCurrentRewardWealthLevel(mdp.wealthFunction(final_state))
-                brv =  mdp.solveMDP(reward_dict)
-                print "best response value ",brv
-                agent.bestResponseValue.append(brv)
-            state = agent.initialState
-            sum_p = max(agent.QValues[state][action] for action in agent.mdp.getAllowedActions(state))
-            agent.score.append(sum_p)
-            cumulative = []
-            sump = 1
-            for w in agent.mdp.getWealthLevels():
-                sump-= agent.real_wealth_frequencies[w]
-                if(sump < agent.q):
-                    print 'q ',w
-                    break
-            print sum(agent.getCurrentRewardWealthLevel(w)*agent.real_wealth_frequencies[w] for w in agent.mdp.getWealthLevels())
-            print agent.theta
+            instrumentation.updateCounters(i,nbEpisodes,getattr(agent,"nbEpsilons",0)-initialEpsilons)
+            if instrumentation.informing:
+                instrumentation.info(i,step)
+                instrumentation.reportCounters()
+            if observer is None:
+                observe(mdp,agent,initialState,i,observationFunctions,instrumentation)
+            else:
+                observer.submit(mdp,agent,initialState,i)
         # Execute transition
         currentAction = agent.chooseAction(currentState)
+        if currentAction == "reinit":
+            nbEpisodes += 1
         nextState = mdp.drawNextState(currentState,currentAction)
         agent.inform(currentState,currentAction,nextState)
-        res.append((currentState,currentAction,nextState))
+        if trace is not None:
+            trace.record(currentState,currentAction,nextState)
+        if statistics is not None:
+            statistics.record(currentState,currentAction,nextState)
         currentState = nextState
-        print "debug", currentAction, nextState
+        if debugging:
+            instrumentation.debug("debug",currentAction,nextState)
+    # Run observers after last step
+    instrumentation.updateCounters(numberOfSteps,nbEpisodes,getattr(agent,"nbEpsilons",0)-initialEpsilons)
+    instrumentation.reportCounters()
+    if observer is None:
+        observe(mdp,agent,initialState,numberOfSteps,observationFunctions,instrumentation,False)
+    else:
+        observer.submit(mdp,agent,initialState,numberOfSteps,False)
+        observer.finish()
+    agent.close()
+    return trace
+
+# Runs a simulation of nbAgents learners in lockstep (see batchlearning), each on its own trajectory
+# starting from initialState, for a given number of steps. Observation functions are called as in
+# simulate, with the batched learner as agent; the score (max Q value of the initial state) and, when
+# the learner has a theta, the best response value are recorded for every learner.
+def simulateBatch (mdp, agent, initialState, numberOfSteps, step, observationFunctions):
+    currentStates = np.repeat(mdp.stateIndex[initialState], agent.nbAgents)
+    initialStates = currentStates.copy()
+    for i in xrange(numberOfSteps):
+        # Run observers
+        if i%step==0:
+            for observationFunction in observationFunctions:
+                observationFunction(mdp,agent,initialState,i)
+            if hasattr(agent,"theta") and not mdp.mdpType == "Garnets":
+                brv = []
+                for rewards in agent.getRewardVectors():
+                    reward_dict = {}
+                    for final_state in mdp.finalStates:
+                        reward_dict[final_state] = rewards[mdp.wealthLevelIndex[mdp.wealthFunction(final_state)]]
+                    brv.append(mdp.solveMDP(reward_dict))
+                agent.bestResponseValue.append(np.array(brv))
+            agent.score.append(agent.getMaxQValues(initialStates))
+        # Execute transitions
+        currentActions = agent.chooseActions(currentStates)
+        nextStates = agent.drawNextStates(currentStates,currentActions)
+        agent.inform(currentStates,currentActions,nextStates)
+        currentStates = nextStates
     # Run observers after last step
     for observationFunction in observationFunctions:
         observationFunction(mdp,agent,initialState,numberOfSteps)
-    return res
+    return agent
 
-# Prints various statistics over a given execution trace
+# Prints various statistics over a given execution trace, given as a list of triples, as a recorder
+# (see traces) or directly as a TraceStatistics; the trace is read once
 def printStats (mdp, trace):
+    statistics = getTraceStatistics(mdp,trace)
     # print ""
     # print "Underlying distribution of next states for"
     # print ""
@@ -77,10 +153,10 @@ def printStats (mdp, trace):
     # print ""
     # for state in mdp.getStates():
     #     for action in mdp.getAllowedActions(state):
-    #         if isExperienced(state,action,trace):
+    #         if statistics.isExperienced(state,action):
     #             print "*",action,"in",state+":",
     #             for nextState in mdp.getStates():
-    #                 frequency = empiricalFrequency(state,action,nextState,trace)
+    #                 frequency = statistics.empiricalFrequency(state,action,nextState)
     #                 if frequency!=0:
     #                     print nextState,"=",str(frequency),"|",
     #             print ""
@@ -91,16 +167,19 @@ def printStats (mdp, trace):
     print "Policy actually played for"
     print ""
     for state in mdp.getStates():
-        if isVisited(state,trace):
+        if statistics.isVisited(state):
             print "*",state+":",
             for action in mdp.getAllowedActions(state):
-                probability = actualPolicy(state,action,trace)
+                probability = statistics.actualPolicy(state,action)
                 if probability!=0:
                     print action,"=",str(probability),"|",
             print ""
         else:
             print "*",state+":","not visited"
 
+# The following functions scan a trace given as a list of triples (state,action,nextState) for
+# every question; use TraceStatistics (through getTraceStatistics) for repeated questions.
+
 # Whether there is at least one triple (state,.,.) in a given trace for given state.
 def isVisited (state, trace):
     for (s,a,ns) in trace:
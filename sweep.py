@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+# ===============================================================================================
+# Hyperparameter sweeps of the QQ-learning agent. A sweep is a grid over theta, constant, tau,
+# epsilon, MDP type and seed; every point of the grid is simulated as an independent task in a pool
+# of processes, and the score, thetas and histories of all tasks are saved in one .npz file.
+# Usage is as given by the printUsageAndExit function; the grid is defined in the dedicated section.
+# ===============================================================================================
+
+import itertools
+import multiprocessing
+import random
+import sys
+
+import numpy as np
+
+from gardner import *
+from grid import *
+from million import *
+from garnets import *
+from datacenter import *
+from qqlearning import *
+from simulation import *
+
+# Constructors of the MDPs which can be swept over
+mdpConstructors = {
+    "gardner": GardnerDiceMDP,
+    "sequentialGardner": SequentialGardnerDiceMDP,
+    "grid": GridMDP,
+    "million": MillionMDP,
+    "garnets": GarnetsMDP,
+    "datacenter": DataCenterMDP,
+}
+
+# MDPs already built by the current (worker) process, by type
+builtMdps = {}
+
+# Returns the list of tasks (dictionaries of parameters) of the grid given by lists of values
+def makeGrid (thetas, constants, taus, epsilons, mdpTypes, seeds):
+    tasks = []
+    for (mdpType,theta,constant,tau,epsilon,seed) in itertools.product(mdpTypes,thetas,constants,taus,epsilons,seeds):
+        tasks.append({"index":len(tasks), "mdpType":mdpType, "theta":theta, "constant":constant, "tau":tau, "epsilon":epsilon, "seed":seed})
+    return tasks
+
+# Returns the MDP of given type, built once per process, and compiled through the model cache in
+# cacheDirectory if not None; the state which changes along runs (including the warm start of the
+# solver and the transition cache) is reset, so that a task does not depend on the previous tasks
+# run by the same process
+def getMdp (mdpType, cacheDirectory=None):
+    if not mdpType in builtMdps:
+        builtMdps[mdpType] = mdpConstructors[mdpType]()
+        if cacheDirectory is not None:
+            builtMdps[mdpType].compile(cacheDirectory)
+    mdp = builtMdps[mdpType]
+    mdp.counter = 0
+    mdp.cumulatedCost = 0
+    mdp.solvedValues = None
+    mdp.setTransitionCache(mdp.maxCacheSize)
+    return mdp
+
+# Simulates one task, given as a tuple (task,nbSteps,step,cacheDirectory); the random streams of the
+# MDP and of the learner, and the global generators, are seeded with the seed of the task, so that
+# results do not depend on which process runs it
+def runTask (arguments):
+    (task,nbSteps,step,cacheDirectory) = arguments
+    mdp = getMdp(task["mdpType"],cacheDirectory)
+    random.seed(task["seed"])
+    np.random.seed(task["seed"])
+    mdp.setSeed(task["seed"])
+    agent = QQLearning(mdp,mdp.initialState,task["epsilon"],task["tau"],task["theta"],task["constant"],seed=task["seed"])
+    # Tasks run silently (the simulation gives its instrumentation to the learner); the rates of the
+    # run are returned with its results
+    instrumentation = Instrumentation(SILENT)
+    simulate(mdp,agent,mdp.initialState,nbSteps,step,[],instrumentation=instrumentation)
+    return {"index":task["index"], "score":np.array(agent.score), "thetas":agent.thetas.getSeries()[1], "histories":agent.histories.getSeries()[1], "counters":instrumentation.getCounters()}
+
+# Runs all tasks in a pool of nbProcesses processes (one per core if None), and saves their
+# parameters and results in resultsFile: for task i, arrays "score_i", "thetas_i" and "histories_i",
+# and the parameters of all tasks in arrays "theta", "constant", "tau", "epsilon", "mdpType", "seed".
+# MDPs are compiled through the model cache in cacheDirectory if not None.
+def runSweep (tasks, nbSteps, step, resultsFile, nbProcesses=None, cacheDirectory=None):
+    results = {}
+    for parameter in ["theta","constant","tau","epsilon","mdpType","seed"]:
+        results[parameter] = np.array([task[parameter] for task in tasks])
+    pool = multiprocessing.Pool(nbProcesses)
+    try:
+        for result in pool.imap_unordered(runTask,[(task,nbSteps,step,cacheDirectory) for task in tasks]):
+            for key in ["score","thetas","histories"]:
+                results[key+"_"+str(result["index"])] = result[key]
+            print "Task",result["index"],"done (%0.1f steps/s)" % result["counters"]["stepsPerSecond"]
+    finally:
+        pool.close()
+        pool.join()
+    np.savez(resultsFile,**results)
+    return results
+
+# Handling program arguments =================================================
+
+def printUsageAndExit ():
+    print "Usage: nbSimulationSteps step resultsFile <nbProcesses> <cacheDirectory>"
+    print "Observation points every step simulation steps, as in main"
+    print "resultsFile: .npz file in which all results are saved"
+    print "nbProcesses: number of worker processes (default: one per core)"
+    print "cacheDirectory: directory of the model cache, from which workers read compiled MDPs (default: none)"
+    sys.exit(1)
+
+def main ():
+    # Change the grid here
+    #garnets theta:20 constant:5
+    #datacenter theta:550 constant:100
+    thetas = [480]
+    constants = [50]
+    taus = [0.5]
+    epsilons = [0.1]
+    mdpTypes = ["datacenter"]
+    seeds = range(10)
+    try:
+        nbSteps = int(sys.argv[1])
+        step = int(sys.argv[2])
+        resultsFile = sys.argv[3]
+        nbProcesses = None
+        if len(sys.argv) > 4:
+            nbProcesses = int(sys.argv[4])
+        # Directory of the model cache, or None
+        cacheDirectory = None
+        if len(sys.argv) > 5:
+            cacheDirectory = sys.argv[5]
+    except (IndexError,ValueError):
+        printUsageAndExit()
+    tasks = makeGrid(thetas,constants,taus,epsilons,mdpTypes,seeds)
+    print "Running",len(tasks),"tasks..."
+    runSweep(tasks,nbSteps,step,resultsFile,nbProcesses,cacheDirectory)
+    print "Sweep: done."
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import numpy as np
+
+# ===============================================================================================
+# Dense storage for the tables of the learners. A DenseTable stores values indexed by
+# [state][action] and a DenseCounter values indexed by [state], as NumPy arrays over the ids given
+# by mdp.buildIndex(). Both can be used in place of the nested dictionaries of the learners:
+# table[state][action] and counter[state] read and write the underlying arrays, and the keys of
+# the row of a state are the actions of the mask given at construction.
+# ===============================================================================================
+
+class DenseTable ():
+
+    # mask: array of booleans indexed by [stateId,actionId], true for the keys of each row
+    def __init__ (self, mdp, mask, dtype=np.float64):
+        mdp.buildIndex()
+        self.mdp = mdp
+        self.mask = mask.copy()
+        self.values = np.zeros(mask.shape, dtype=dtype)
+
+    # Scalar accesses go through item/itemset, which avoid creating NumPy scalars
+    def getValue (self, state, action):
+        return self.values.item(self.mdp.stateIndex[state],self.mdp.actionIndex[action])
+
+    def setValue (self, state, action, value):
+        stateId = self.mdp.stateIndex[state]
+        actionId = self.mdp.actionIndex[action]
+        self.values.itemset((stateId,actionId),value)
+        self.mask.itemset((stateId,actionId),True)
+
+    def addValue (self, state, action, amount):
+        stateId = self.mdp.stateIndex[state]
+        actionId = self.mdp.actionIndex[action]
+        self.values.itemset((stateId,actionId),self.values.item(stateId,actionId)+amount)
+        self.mask.itemset((stateId,actionId),True)
+
+    # Maximum value in the row of state over the actions of mask (indexed by [stateId,actionId])
+    def getMax (self, state, mask):
+        stateId = self.mdp.stateIndex[state]
+        return self.values[stateId][mask[stateId]].max().item()
+
+    # Actions of mask with maximum value in the row of state
+    def getArgMax (self, state, mask):
+        stateId = self.mdp.stateIndex[state]
+        actionIds = np.flatnonzero(mask[stateId])
+        row = self.values[stateId,actionIds]
+        return [self.mdp.actions[actionId] for actionId in actionIds[row==row.max()]]
+
+    # Dictionary-like access ===========================================================
+
+    def __getitem__ (self, state):
+        return DenseRow(self, self.mdp.stateIndex[state])
+
+    def __contains__ (self, state):
+        return state in self.mdp.stateIndex
+
+    def __iter__ (self):
+        return iter(self.mdp.states)
+
+    def __len__ (self):
+        return len(self.mdp.states)
+
+    def keys (self):
+        return list(self.mdp.states)
+
+
+class DenseRow ():
+
+    def __init__ (self, table, stateId):
+        self.table = table
+        self.stateId = stateId
+
+    def __getitem__ (self, action):
+        actionId = self.table.mdp.actionIndex[action]
+        if not self.table.mask[self.stateId,actionId]:
+            raise KeyError(action)
+        return self.table.values.item(self.stateId,actionId)
+
+    def __setitem__ (self, action, value):
+        actionId = self.table.mdp.actionIndex[action]
+        self.table.values[self.stateId,actionId] = value
+        self.table.mask[self.stateId,actionId] = True
+
+    def __contains__ (self, action):
+        return action in self.table.mdp.actionIndex and self.table.mask[self.stateId,self.table.mdp.actionIndex[action]]
+
+    def __iter__ (self):
+        return iter(self.keys())
+
+    def __len__ (self):
+        return int(self.table.mask[self.stateId].sum())
+
+    def keys (self):
+        return [self.table.mdp.actions[actionId] for actionId in np.flatnonzero(self.table.mask[self.stateId])]
+
+    def values (self):
+        return list(self.table.values[self.stateId][self.table.mask[self.stateId]])
+
+    def items (self):
+        return zip(self.keys(),self.values())
+
+    def __str__ (self):
+        return str(dict(self.items()))
+
+
+class DenseCounter ():
+
+    def __init__ (self, mdp, dtype=np.int64):
+        mdp.buildIndex()
+        self.mdp = mdp
+        self.values = np.zeros(len(mdp.states), dtype=dtype)
+
+    def addValue (self, state, amount):
+        stateId = self.mdp.stateIndex[state]
+        self.values.itemset(stateId,self.values.item(stateId)+amount)
+
+    def __getitem__ (self, state):
+        return self.values.item(self.mdp.stateIndex[state])
+
+    def __setitem__ (self, state, value):
+        self.values[self.mdp.stateIndex[state]] = value
+
+    def __contains__ (self, state):
+        return state in self.mdp.stateIndex
+
+    def __iter__ (self):
+        return iter(self.mdp.states)
+
+    def __len__ (self):
+        return len(self.mdp.states)
+
+    def keys (self):
+        return list(self.mdp.states)
+
+
+# Maximum Q value and greedy actions of every state, for a learner whose Q values are read through
+# getValue(state,action). The entry of a state is computed by a scan of its allowed actions when first
+# asked, and then kept up to date by update for every change of a Q value; a scan is needed again only
+# when the only greedy action of a state loses value. Greedy actions are listed in the order of the
+# allowed actions (of their ids for dense learners), as a scan would list them. Once trackChanges has
+# been called, the states whose Q values change are also collected, for planners (see planning).
+class MaxQIndex ():
+
+    # table: the DenseTable of Q values of a dense learner, whose rows are then scanned as arrays
+    def __init__ (self, mdp, table=None):
+        self.mdp = mdp
+        self.table = table
+        self.maxValues = {}
+        self.argMaxes = {}
+        # Allowed actions of a state in the order of greedy actions, their ids, and their ranks
+        self.orders = {}
+        self.actionIds = {}
+        self.ranks = {}
+        # States whose Q values changed since the last call to popChangedStates, or None if not tracked
+        self.changedStates = None
+
+    def trackChanges (self):
+        if self.changedStates is None:
+            self.changedStates = set()
+
+    # Returns the states whose Q values changed since the last call, and forgets them
+    def popChangedStates (self):
+        changedStates = self.changedStates
+        self.changedStates = set()
+        return changedStates
+
+    def getRanks (self, state):
+        if not state in self.ranks:
+            if self.table is not None:
+                actionIds = np.flatnonzero(self.mdp.allowedMask[self.mdp.stateIndex[state]])
+                self.actionIds[state] = actionIds
+                actions = [self.mdp.actions[actionId] for actionId in actionIds]
+            else:
+                actions = self.mdp.getAllowedActions(state)
+            self.orders[state] = list(actions)
+            self.ranks[state] = dict((action,rank) for (rank,action) in enumerate(actions))
+        return self.ranks[state]
+
+    def scan (self, state, getValue):
+        self.getRanks(state)
+        if not self.orders[state]:
+            raise ValueError("No allowed action in "+str(state))
+        if self.table is not None:
+            actionIds = self.actionIds[state]
+            row = self.table.values[self.mdp.stateIndex[state],actionIds]
+            bestValue = row.max()
+            self.maxValues[state] = bestValue.item()
+            self.argMaxes[state] = [self.mdp.actions[actionId] for actionId in actionIds[row==bestValue]]
+            return
+        bestValue = None
+        bestActions = []
+        for action in self.orders[state]:
+            value = getValue(state,action)
+            if bestValue==None or value>bestValue:
+                bestValue = value
+                bestActions = [action]
+            elif value==bestValue:
+                bestActions.append(action)
+        self.maxValues[state] = bestValue
+        self.argMaxes[state] = bestActions
+
+    def getMax (self, state, getValue):
+        if not state in self.maxValues:
+            self.scan(state,getValue)
+        return self.maxValues[state]
+
+    def getArgMax (self, state, getValue):
+        if not state in self.argMaxes:
+            self.scan(state,getValue)
+        return self.argMaxes[state]
+
+    # Forgets the entry of state, after its Q values were changed without update
+    def invalidate (self, state):
+        if self.changedStates is not None:
+            self.changedStates.add(state)
+        self.maxValues.pop(state,None)
+        self.argMaxes.pop(state,None)
+
+    # Forgets the entries of the states of given ids (an array, possibly with repetitions)
+    def invalidateIds (self, stateIds):
+        maxValues = self.maxValues
+        argMaxes = self.argMaxes
+        states = [self.mdp.states[stateId] for stateId in set(stateIds.tolist())]
+        if self.changedStates is not None:
+            self.changedStates.update(states)
+        for state in states:
+            maxValues.pop(state,None)
+            argMaxes.pop(state,None)
+
+    # Takes into account that the Q value of (state,action) is now value
+    def update (self, state, action, value, getValue):
+        if self.changedStates is not None:
+            self.changedStates.add(state)
+        if not state in self.maxValues:
+            return
+        ranks = self.getRanks(state)
+        if not action in ranks:
+            return
+        bestValue = self.maxValues[state]
+        bestActions = self.argMaxes[state]
+        if value > bestValue:
+            self.maxValues[state] = value
+            self.argMaxes[state] = [action]
+        elif value == bestValue:
+            if not action in bestActions:
+                bestActions.append(action)
+                bestActions.sort(key=ranks.get)
+        elif action in bestActions:
+            if len(bestActions) > 1:
+                bestActions.remove(action)
+            else:
+                self.scan(state,getValue)
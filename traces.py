@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import collections
+
+import numpy as np
+
+# ===============================================================================================
+# Recorders of execution traces, for the simulation module. A recorder is given every transition
+# (state,action,nextState) through record, and iterating over it gives the recorded triples, oldest
+# first, so that it can be used wherever a trace given as a list of triples is expected.
+#
+# - FullTrace keeps all triples in a list (memory grows with the number of steps)
+# - RingTrace keeps only the last capacity triples
+# - ColumnarTrace keeps all transitions as int32 ids of the MDP, in three columns grown by chunks
+# ===============================================================================================
+
+class FullTrace ():
+
+    def __init__ (self):
+        self.triples = []
+
+    def record (self, state, action, nextState):
+        self.triples.append((state,action,nextState))
+
+    def __iter__ (self):
+        return iter(self.triples)
+
+    def __len__ (self):
+        return len(self.triples)
+
+
+class RingTrace ():
+
+    def __init__ (self, capacity):
+        self.triples = collections.deque(maxlen=capacity)
+
+    def record (self, state, action, nextState):
+        self.triples.append((state,action,nextState))
+
+    def __iter__ (self):
+        return iter(self.triples)
+
+    def __len__ (self):
+        return len(self.triples)
+
+
+class ColumnarTrace ():
+
+    def __init__ (self, mdp, chunkSize=65536):
+        mdp.buildIndex()
+        self.mdp = mdp
+        self.chunkSize = chunkSize
+        self.size = 0
+        # Full chunks, and the chunk being filled (columns of shape (3,chunkSize))
+        self.chunks = []
+        self.chunk = np.zeros((3,chunkSize), dtype=np.int32)
+        self.chunkFill = 0
+
+    def record (self, state, action, nextState):
+        if self.chunkFill == self.chunkSize:
+            self.chunks.append(self.chunk)
+            self.chunk = np.zeros((3,self.chunkSize), dtype=np.int32)
+            self.chunkFill = 0
+        self.chunk[0,self.chunkFill] = self.mdp.stateIndex[state]
+        self.chunk[1,self.chunkFill] = self.mdp.actionIndex[action]
+        self.chunk[2,self.chunkFill] = self.mdp.stateIndex[nextState]
+        self.chunkFill += 1
+        self.size += 1
+
+    # Returns the arrays (stateIds,actionIds,nextStateIds) of the recorded transitions
+    def getColumns (self):
+        columns = np.concatenate(self.chunks+[self.chunk[:,:self.chunkFill]], axis=1)
+        return columns[0], columns[1], columns[2]
+
+    def __iter__ (self):
+        states = self.mdp.states
+        actions = self.mdp.actions
+        for chunk in self.chunks+[self.chunk[:,:self.chunkFill]]:
+            for (stateId,actionId,nextStateId) in chunk.T.tolist():
+                yield (states[stateId],actions[actionId],states[nextStateId])
+
+    def __len__ (self):
+        return self.size
+
+
+# Returns a recorder for given mode: "off" (None), "full", "ring" (keeping the last capacity
+# transitions) or "columnar"
+def makeTrace (mdp, mode, capacity=100000):
+    if mode == "off":
+        return None
+    if mode == "full":
+        return FullTrace()
+    if mode == "ring":
+        return RingTrace(capacity)
+    if mode == "columnar":
+        return ColumnarTrace(mdp)
+    raise ValueError("Unknown trace mode "+str(mode))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Xining Wang
+"""
+
+import numpy as np
+
+# ===============================================================================================
+# Statistics over execution traces: numbers of visits to states, of experiences of (state,action)
+# and of transitions (state,action,nextState), from which the policy actually played and the
+# empirical distributions of next states are answered in constant time. The counters are filled
+# either in one vectorised pass over a whole trace (addTrace), or transition by transition while a
+# simulation runs (record).
+# ===============================================================================================
+
+class TraceStatistics ():
+
+    def __init__ (self, mdp):
+        mdp.buildIndex()
+        self.mdp = mdp
+        self.nbStates = len(mdp.states)
+        self.nbActions = len(mdp.actions)
+        self.visits = np.zeros(self.nbStates, dtype=np.int64)
+        self.experiences = np.zeros((self.nbStates,self.nbActions), dtype=np.int64)
+        # Number of transitions, indexed by (stateId*nbActions+actionId)*nbStates+nextStateId
+        self.transitions = {}
+
+    def record (self, state, action, nextState):
+        stateId = self.mdp.stateIndex[state]
+        actionId = self.mdp.actionIndex[action]
+        self.visits[stateId] += 1
+        self.experiences[stateId,actionId] += 1
+        key = (stateId*self.nbActions+actionId)*self.nbStates+self.mdp.stateIndex[nextState]
+        self.transitions[key] = self.transitions.get(key,0)+1
+
+    # Adds the transitions given as arrays of ids
+    def addColumns (self, stateIds, actionIds, nextStateIds):
+        stateIds = np.asarray(stateIds, dtype=np.int64)
+        actionIds = np.asarray(actionIds, dtype=np.int64)
+        nextStateIds = np.asarray(nextStateIds, dtype=np.int64)
+        self.visits += np.bincount(stateIds, minlength=self.nbStates)
+        rows = stateIds*self.nbActions+actionIds
+        self.experiences += np.bincount(rows, minlength=self.nbStates*self.nbActions).reshape(self.nbStates,self.nbActions)
+        (keys,counts) = np.unique(rows*self.nbStates+nextStateIds, return_counts=True)
+        for (key,count) in zip(keys.tolist(),counts.tolist()):
+            self.transitions[key] = self.transitions.get(key,0)+count
+
+    # Adds all transitions of a trace, given as a recorder with columns of ids (see traces) or as
+    # any iterable of triples (state,action,nextState)
+    def addTrace (self, trace):
+        if hasattr(trace,"getColumns"):
+            self.addColumns(*trace.getColumns())
+            return
+        stateIndex = self.mdp.stateIndex
+        actionIndex = self.mdp.actionIndex
+        columns = [(stateIndex[s],actionIndex[a],stateIndex[ns]) for (s,a,ns) in trace]
+        if columns:
+            self.addColumns(*zip(*columns))
+
+    def isVisited (self, state):
+        return self.visits[self.mdp.stateIndex[state]] > 0
+
+    def isExperienced (self, state, action):
+        return self.experiences[self.mdp.stateIndex[state],self.mdp.actionIndex[action]] > 0
+
+    # Frequency of play of action in state; assumes that state has been visited
+    def actualPolicy (self, state, action):
+        stateId = self.mdp.stateIndex[state]
+        return self.experiences.item(stateId,self.mdp.actionIndex[action])/float(self.visits[stateId])
+
+    # Frequency of nextState after action in state; assumes that (state,action) has been experienced
+    def empiricalFrequency (self, state, action, nextState):
+        stateId = self.mdp.stateIndex[state]
+        actionId = self.mdp.actionIndex[action]
+        key = (stateId*self.nbActions+actionId)*self.nbStates+self.mdp.stateIndex[nextState]
+        return self.transitions.get(key,0)/float(self.experiences[stateId,actionId])
+
+
+# Returns statistics over a trace, which may already be a TraceStatistics
+def getTraceStatistics (mdp, trace):
+    if isinstance(trace,TraceStatistics):
+        return trace
+    statistics = TraceStatistics(mdp)
+    statistics.addTrace(trace)
+    return statistics
@@ -17,12 +17,16 @@ def innerProduct (vector, otherVector):
 
 # ===============================================================================================
 # Utilities for manipulation of distributions (of probabilities). Distributions are represented
-# by dictionaries (sparse, with null entries omitted).
+# by dictionaries (sparse, with null entries omitted), or by ScaledDistribution objects for
+# distributions over a known list of elements which are updated often.
 # ===============================================================================================
 
 # Updates a distribution D by (1-coef)D(elem)+coef*value for some element, and (1-coef)D(y) for others
 # Sets element to value if distribution is null everywhere
 def dynamic_mean (distribution, element, coefficient):
+    if isinstance(distribution,ScaledDistribution):
+        distribution.update(element,coefficient)
+        return
     isNull = True
     for oneElement in distribution.keys():
         if distribution[oneElement]!=0.:
@@ -40,6 +44,88 @@ def dynamic_mean (distribution, element, coefficient):
             distribution[oneElement] = (1.-coefficient)*distribution[oneElement]
     # elements not in the distribution remain at 0
 
+# A distribution over a fixed list of elements, for repeated dynamic means: the probability of an
+# element is scale*weights[i], so that the update of dynamic_mean only changes scale and the weight of
+# the element. Weights are renormalised (scale folded into them) when scale is about to underflow.
+# It can be used as the dictionary of a distribution (d[element], keys, items...).
+class ScaledDistribution ():
+
+    # Below this scale, weights are renormalised
+    minScale = 1e-150
+
+    def __init__ (self, elements, value=0.):
+        self.elements = list(elements)
+        self.index = dict((element,i) for (i,element) in enumerate(self.elements))
+        self.weights = [float(value)]*len(self.elements)
+        self.scale = 1.
+        self.isNull = value==0.
+
+    def update (self, element, coefficient):
+        if not element in self.index:
+            self.addElement(element)
+        i = self.index[element]
+        if self.isNull or coefficient==1.:
+            self.weights = [0.]*len(self.elements)
+            self.weights[i] = 1.
+            self.scale = 1.
+            self.isNull = False
+            return
+        self.scale *= 1.-coefficient
+        if self.scale < self.minScale:
+            self.renormalise()
+        self.weights[i] += coefficient/self.scale
+
+    def renormalise (self):
+        scale = self.scale
+        self.weights = [weight*scale for weight in self.weights]
+        self.scale = 1.
+
+    def addElement (self, element):
+        self.index[element] = len(self.elements)
+        self.elements.append(element)
+        self.weights.append(0.)
+
+    # Dictionary-like access ===========================================================
+
+    def __getitem__ (self, element):
+        return self.scale*self.weights[self.index[element]]
+
+    def __setitem__ (self, element, value):
+        if not element in self.index:
+            self.addElement(element)
+        self.weights[self.index[element]] = value/self.scale
+        if value != 0.:
+            self.isNull = False
+        elif not self.isNull:
+            self.isNull = not any(self.weights)
+
+    def get (self, element, default=None):
+        if element in self.index:
+            return self[element]
+        return default
+
+    def __contains__ (self, element):
+        return element in self.index
+
+    def __iter__ (self):
+        return iter(self.elements)
+
+    def __len__ (self):
+        return len(self.elements)
+
+    def keys (self):
+        return list(self.elements)
+
+    def values (self):
+        scale = self.scale
+        return [weight*scale for weight in self.weights]
+
+    def items (self):
+        return zip(self.elements,self.values())
+
+    def __repr__ (self):
+        return repr(dict(self.items()))
+
 
 # Turns a distribution to a vector of probabilities, given some order on all elements (as a list).
 def distributionToVector (distribution, allElements):